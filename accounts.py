@@ -0,0 +1,179 @@
+"""
+Аккаунты makefilm.ai и распределение задач между ними
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import List, Optional
+
+from playwright.async_api import BrowserContext
+
+from page_pool import PagePool
+
+logger = logging.getLogger(__name__)
+
+
+class AccountUnavailableError(Exception):
+    """
+    Аккаунт не может выполнять генерации: слетела авторизация или закончилась квота
+    """
+
+    def __init__(self, message: str, reason: str = 'auth'):
+        super().__init__(message)
+        self.reason = reason
+
+
+class Account:
+    """
+    Аккаунт makefilm.ai со своим изолированным контекстом браузера и пулом страниц
+    """
+
+    def __init__(self, name: str, state_path: str):
+        self.name = name
+        self.state_path = state_path
+        self.context: Optional[BrowserContext] = None
+        self.pool: Optional[PagePool] = None
+        self.active_jobs = 0
+        self.total_jobs = 0
+        self.unavailable_until = 0.0
+        self.last_error: Optional[str] = None
+        # Задач с момента создания текущего контекста и флаг перезапуска контекста
+        self.context_jobs = 0
+        self.draining = False
+
+    @property
+    def ready(self) -> bool:
+        return self.context is not None and self.pool is not None
+
+    @property
+    def healthy(self) -> bool:
+        return self.ready and not self.draining and time.monotonic() >= self.unavailable_until
+
+    def __repr__(self) -> str:
+        return f"Account({self.name!r})"
+
+
+def discover_accounts(state_paths: str, states_dir: str, default_path: str) -> List[Account]:
+    """
+    Собирает список аккаунтов: из перечня файлов через запятую, из каталога
+    с файлами <имя>.json или, если ничего не задано, из одного файла по умолчанию.
+    Файл по умолчанию не добавляется к аккаунтам из каталога.
+    """
+    paths = [path.strip() for path in state_paths.split(',') if path.strip()]
+    if not paths and states_dir and os.path.isdir(states_dir):
+        paths = sorted(
+            os.path.join(states_dir, name) for name in os.listdir(states_dir) if name.endswith('.json')
+        )
+        if paths and os.path.exists(default_path):
+            logger.warning(
+                f"Аккаунты берутся из {states_dir}, {default_path} не используется — "
+                f"сохраните его аккаунт через save_auth_state.py --account <имя>"
+            )
+    if not paths:
+        paths = [default_path]
+    return [Account(os.path.splitext(os.path.basename(path))[0], path) for path in paths]
+
+
+def auth_cookie_expiry(state_path: str, domain: str) -> Optional[float]:
+    """
+    Самый поздний срок действия cookies домена в файле состояния (unix time).
+    None — cookies домена нет, inf — есть сессионные cookies без срока
+    """
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            cookies = json.load(f).get('cookies', [])
+    except (OSError, ValueError, AttributeError):
+        return None
+    domain = domain.lower()
+    expiry = None
+    for cookie in cookies:
+        cookie_domain = cookie.get('domain', '').lstrip('.').lower()
+        if not cookie_domain or not (domain == cookie_domain or domain.endswith('.' + cookie_domain)):
+            continue
+        expires = cookie.get('expires', -1)
+        value = float('inf') if expires is None or expires < 0 else float(expires)
+        expiry = value if expiry is None else max(expiry, value)
+    return expiry
+
+
+class AccountScheduler:
+    """
+    Выбирает для задачи наименее загруженный исправный аккаунт.
+
+    Аккаунт, сообщивший об ошибке авторизации или квоты, выводится из ротации
+    на cooldown секунд.
+    """
+
+    def __init__(self, accounts: List[Account], cooldown: float = 600.0):
+        self.accounts = accounts
+        self.cooldown = cooldown
+        self._changed: Optional[asyncio.Event] = None
+
+    def _event(self) -> asyncio.Event:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def _pick(self, exclude: List[Account]) -> Optional[Account]:
+        candidates = [account for account in self.accounts if account.healthy and account not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda account: (account.active_jobs, account.total_jobs))
+
+    async def acquire(self, timeout: Optional[float] = None, exclude: Optional[List[Account]] = None) -> Account:
+        """
+        Резервирует аккаунт под задачу, ожидая возврата аккаунта в ротацию не дольше timeout.
+        Аккаунты из exclude (уже отказавшие этой задаче) не выбираются.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        exclude = exclude or []
+        while True:
+            account = self._pick(exclude)
+            if account:
+                account.active_jobs += 1
+                account.total_jobs += 1
+                account.context_jobs += 1
+                return account
+            # Аккаунт с перезапускаемым контекстом скоро вернется — ждем его, а не отказываем
+            waiting = [a.unavailable_until for a in self.accounts if (a.ready or a.draining) and a not in exclude]
+            if not waiting:
+                raise AccountUnavailableError("Нет доступных аккаунтов makefilm.ai")
+            wait = max(0.1, min(waiting) - time.monotonic())
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise AccountUnavailableError("Все аккаунты makefilm.ai временно недоступны")
+                wait = min(wait, remaining)
+            event = self._event()
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, account: Account):
+        """
+        Освобождает аккаунт после задачи
+        """
+        account.active_jobs = max(0, account.active_jobs - 1)
+        self._event().set()
+
+    def wake(self):
+        """
+        Будит задачи, ожидающие аккаунт (например, после перезапуска контекста)
+        """
+        self._event().set()
+
+    def mark_unavailable(self, account: Account, error: AccountUnavailableError):
+        """
+        Временно выводит аккаунт из ротации
+        """
+        account.unavailable_until = time.monotonic() + self.cooldown
+        account.last_error = f"{error.reason}: {error}"
+        logger.warning(
+            f"⛔ Аккаунт {account.name} выведен из ротации на {self.cooldown:.0f} сек ({account.last_error})"
+        )
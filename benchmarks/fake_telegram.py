@@ -0,0 +1,108 @@
+"""
+Поддельный Telegram Bot API для бенчмарков: принимает вызовы бота локально
+и запоминает, когда какому чату ушли сообщения и фото
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+
+class FakeTelegramAPI:
+    """
+    Минимальная реализация методов Bot API, которые использует бот
+    """
+
+    def __init__(self):
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self.calls: Dict[str, int] = {}
+        # chat_id -> время отправки каждого фото (time.monotonic())
+        self.photos: Dict[int, List[float]] = {}
+        self.texts: Dict[int, List[str]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+    def _message(self, chat_id: int, **extra) -> dict:
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+        }
+        message.update(extra)
+        return message
+
+    def _photo(self) -> list:
+        file_id = f"bench-file-{next(self._file_ids)}"
+        return [{'file_id': file_id, 'file_unique_id': file_id, 'width': 512, 'height': 512}]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        data = await request.post()
+        chat_id = int(data['chat_id']) if 'chat_id' in data else 0
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        elif method == 'sendMessage':
+            self.texts.setdefault(chat_id, []).append(data.get('text', ''))
+            result = self._message(chat_id, text=data.get('text', ''))
+        elif method == 'editMessageText':
+            self.texts.setdefault(chat_id, []).append(data.get('text', ''))
+            result = self._message(chat_id, text=data.get('text', ''))
+        elif method in ('sendPhoto', 'sendDocument'):
+            if method == 'sendPhoto':
+                self.photos.setdefault(chat_id, []).append(time.monotonic())
+            result = self._message(chat_id, photo=self._photo(), caption=data.get('caption', ''))
+        elif method == 'sendMediaGroup':
+            media = json.loads(data.get('media', '[]'))
+            self.photos.setdefault(chat_id, []).extend(time.monotonic() for _ in media)
+            result = [self._message(chat_id, photo=self._photo(), media_group_id='1') for _ in media]
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8091) -> str:
+        """
+        Запускает сервер и возвращает его базовый адрес
+        """
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(args):
+    api = FakeTelegramAPI()
+    url = await api.start(args.host, args.port)
+    print(f"Поддельный Bot API запущен: {url} (TELEGRAM_API_URL={url})")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"Вызовы: {api.calls}")
+    finally:
+        await api.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Поддельный Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8091)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
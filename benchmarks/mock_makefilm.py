@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Локальный стенд makefilm.ai для бенчмарков: страница генератора с той же
+DOM-структурой (поле промпта, меню V1, кнопка Generate, img[alt="Generated image"],
+меню watermark) и настраиваемыми задержкой и долей ошибок генерации.
+
+Запуск отдельно:
+    python3 benchmarks/mock_makefilm.py --port 8090 --delay 5 --jitter 2 --failure-rate 0.05
+"""
+
+import argparse
+import asyncio
+import html
+import itertools
+import random
+import struct
+import zlib
+from typing import Optional
+
+from aiohttp import web
+
+# Классы кнопки Generate — как на makefilm.ai, бот ищет её по полному CSS-пути
+GENERATE_BUTTON_CLASSES = (
+    "inline-flex items-center justify-center gap-2 whitespace-nowrap ring-offset-background "
+    "focus-visible:outline-none focus-visible:ring-2 focus-visible:ring-ring focus-visible:ring-offset-2 "
+    "disabled:pointer-events-none disabled:opacity-50 [&_svg]:pointer-events-none [&_svg]:size-4 "
+    "[&_svg]:shrink-0 hover:bg-primary/90 py-2 px-6 h-8 rounded-lg bg-gradient-to-r from-blue-600 "
+    "via-blue-500 to-blue-400 hover:from-blue-700 hover:via-blue-600 hover:to-blue-500 "
+    "disabled:from-gray-300 disabled:to-gray-400 disabled:cursor-not-allowed shadow-lg hover:shadow-xl "
+    "transition-all duration-200 text-white font-medium text-sm border-0"
+)
+
+HOME_HTML = """<!doctype html>
+<html><head><title>makefilm mock</title></head>
+<body><a href="/workspace/image-generator">Workspace</a> <a href="/profile">Profile</a></body></html>
+"""
+
+GENERATOR_HTML = """<!doctype html>
+<html><head><title>Image generator (mock)</title></head>
+<body>
+<div><div>
+  <div class="flex-1 flex flex-col">
+    <main><div><div><div>
+      <div class="px-8 pt-1"><div><div>
+        <div class="p-4 pb-12"><textarea placeholder="Describe your image"></textarea></div>
+        <div class="absolute bottom-3 right-4 flex items-center gap-3">
+          <div><div><button id="model-button" aria-haspopup="listbox">V2</button></div></div>
+          <button class="{generate_classes}">Generate</button>
+        </div>
+      </div></div></div>
+      <div id="results"></div>
+    </div></div></div></main>
+  </div>
+</div></div>
+<script>
+const modelButton = document.getElementById('model-button');
+modelButton.addEventListener('click', () => {{
+  const listbox = document.createElement('div');
+  listbox.setAttribute('role', 'listbox');
+  for (const name of ['V1', 'V2']) {{
+    const option = document.createElement('div');
+    option.setAttribute('role', 'option');
+    option.textContent = name;
+    option.addEventListener('click', () => {{ modelButton.textContent = name; listbox.remove(); }});
+    listbox.appendChild(option);
+  }}
+  document.body.appendChild(listbox);
+}});
+
+function addResult(id) {{
+  const results = document.getElementById('results');
+  const previous = document.getElementById('radix-:ru:');
+  if (previous) previous.removeAttribute('id');
+  const card = document.createElement('div');
+  card.innerHTML = '<img alt="Generated image" src="/images/' + id + '.png">' +
+    '<button id="radix-:ru:" aria-haspopup="menu">...</button>';
+  card.querySelector('button').addEventListener('click', () => {{
+    const menu = document.createElement('div');
+    menu.setAttribute('role', 'menu');
+    const item = document.createElement('div');
+    item.setAttribute('role', 'menuitem');
+    item.textContent = 'Remove watermark';
+    item.addEventListener('click', () => {{
+      const link = document.createElement('a');
+      link.href = '/download/' + id + '.png';
+      link.download = id + '.png';
+      document.body.appendChild(link);
+      link.click();
+      link.remove();
+      menu.remove();
+    }});
+    menu.appendChild(item);
+    document.body.appendChild(menu);
+  }});
+  results.prepend(card);
+}}
+
+document.querySelector('button.bg-gradient-to-r').addEventListener('click', async () => {{
+  const prompt = document.querySelector('textarea').value;
+  const response = await fetch('/api/generate', {{
+    method: 'POST', headers: {{'Content-Type': 'application/json'}}, body: JSON.stringify({{prompt}})
+  }});
+  const data = await response.json();
+  if (response.ok) {{
+    addResult(data.id);
+  }} else {{
+    const error = document.createElement('div');
+    error.textContent = data.error;
+    document.getElementById('results').prepend(error);
+  }}
+}});
+</script>
+</body></html>
+""".format(generate_classes=html.escape(GENERATE_BUTTON_CLASSES))
+
+
+def make_png(width: int, height: int, padding: int = 0) -> bytes:
+    """
+    Собирает корректный PNG заданного размера (однотонный), с необязательным
+    текстовым блоком padding байт для имитации тяжелых изображений
+    """
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    row = b'\x00' + b'\x40\x80\xc0' * width
+    raw = zlib.compress(row * height, 9)
+    png = b'\x89PNG\r\n\x1a\n'
+    png += chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    if padding:
+        png += chunk(b'tEXt', b'Comment\x00' + b'x' * padding)
+    png += chunk(b'IDAT', raw)
+    png += chunk(b'IEND', b'')
+    return png
+
+
+class MockMakefilm:
+    """
+    Стенд генератора: каждая генерация длится delay ± jitter секунд
+    и с вероятностью failure_rate завершается ошибкой
+    """
+
+    def __init__(self, delay: float = 5.0, jitter: float = 1.0, failure_rate: float = 0.0,
+                 image_size: int = 512, image_padding: int = 0, seed: Optional[int] = None):
+        self.delay = delay
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.image = make_png(image_size, image_size, image_padding)
+        self.random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self.generations = 0
+        self.failures = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/', self.handle_home)
+        app.router.add_get('/workspace/image-generator', self.handle_generator)
+        app.router.add_post('/api/generate', self.handle_generate)
+        app.router.add_get('/images/{name}', self.handle_image)
+        app.router.add_get('/download/{name}', self.handle_download)
+        return app
+
+    async def handle_home(self, request: web.Request) -> web.Response:
+        return web.Response(text=HOME_HTML, content_type='text/html')
+
+    async def handle_generator(self, request: web.Request) -> web.Response:
+        return web.Response(text=GENERATOR_HTML, content_type='text/html')
+
+    async def handle_generate(self, request: web.Request) -> web.Response:
+        await request.json()
+        self.generations += 1
+        await asyncio.sleep(max(0.0, self.delay + self.random.uniform(-self.jitter, self.jitter)))
+        if self.random.random() < self.failure_rate:
+            self.failures += 1
+            return web.json_response({'error': 'Generation failed'}, status=500)
+        return web.json_response({'id': f"gen{next(self._ids)}"})
+
+    async def handle_image(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.image, content_type='image/png')
+
+    async def handle_download(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.image,
+            content_type='image/png',
+            headers={'Content-Disposition': f'attachment; filename="{request.match_info["name"]}"'},
+        )
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8090) -> str:
+        """
+        Запускает стенд и возвращает его базовый адрес
+        """
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(args):
+    mock = MockMakefilm(args.delay, args.jitter, args.failure_rate, args.image_size, args.image_padding)
+    url = await mock.start(args.host, args.port)
+    print(f"Стенд makefilm запущен: {url}/workspace/image-generator")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Локальный стенд makefilm.ai")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--delay', type=float, default=5.0, help="средняя длительность генерации, сек")
+    parser.add_argument('--jitter', type=float, default=1.0, help="разброс длительности, сек")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="доля неудачных генераций (0..1)")
+    parser.add_argument('--image-size', type=int, default=512, help="сторона изображения, px")
+    parser.add_argument('--image-padding', type=int, default=0, help="дополнительный размер PNG, байт")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Отправляет тестовые обновления Telegram на webhook бота — для проверки режима
+UPDATES_MODE=webhook без Telegram (ответы бота удобно принимать через
+benchmarks/fake_telegram.py, см. README).
+
+Пример:
+    python3 benchmarks/post_update.py --url http://127.0.0.1:8080/webhook --secret s3cret --text "котик в саду"
+"""
+
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+from run_benchmark import make_update
+
+
+async def post_updates(args):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret} if args.secret else {}
+    first_id = int(time.time())
+    async with aiohttp.ClientSession() as session:
+        for i in range(args.count):
+            update = make_update(first_id + i, args.chat_id, args.text)
+            started = time.monotonic()
+            async with session.post(args.url, json=update, headers=headers) as response:
+                elapsed = (time.monotonic() - started) * 1000
+                print(f"update {update['update_id']}: HTTP {response.status} за {elapsed:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправка тестовых обновлений на webhook бота")
+    parser.add_argument('--url', default='http://127.0.0.1:8080/webhook')
+    parser.add_argument('--secret', default='', help="WEBHOOK_SECRET бота")
+    parser.add_argument('--text', default='/start')
+    parser.add_argument('--chat-id', type=int, default=1000)
+    parser.add_argument('--count', type=int, default=1)
+    asyncio.run(post_updates(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
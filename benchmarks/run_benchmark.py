@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Офлайн-бенчмарк бота: локальный стенд makefilm.ai, поддельный Telegram Bot API
+и настоящие обработчики из bot_with_storage.py.
+
+Пример:
+    python3 benchmarks/run_benchmark.py --jobs 40 --concurrency 10 --workers 4 --delay 5
+
+Выводит пропускную способность (задач/мин), перцентили задержки ответа
+и длительности этапов, а также память браузера.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_telegram import FakeTelegramAPI  # noqa: E402
+from benchmarks.mock_makefilm import MockMakefilm  # noqa: E402
+from procinfo import descendants_rss  # noqa: E402
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q * (len(values) - 1))))]
+
+
+def configure_environment(args, base_url: str, workdir: str):
+    """
+    Настраивает бота на стенд до импорта bot_with_storage (конфигурация читается при импорте)
+    """
+    state_path = os.path.join(workdir, 'bench.json')
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump({'cookies': [], 'origins': []}, f)
+    os.environ.update({
+        'TELEGRAM_TOKEN': '123456:BENCHMARK',
+        'MAKEFILM_BASE_URL': base_url,
+        'AUTH_STATE_PATHS': state_path,
+        'WORKERS_COUNT': str(args.workers),
+        'QUEUE_MAX_SIZE': str(max(args.jobs, 1)),
+        'TIMEOUT_SECONDS': str(args.timeout),
+        'CACHE_DIR': os.path.join(workdir, 'cache'),
+        'MEDIA_DIR': os.path.join(workdir, 'media'),
+        'METRICS_PORT': '0',
+        'HEADLESS': '0' if args.headed else '1',
+        'NETWORK_PROFILE': args.network_profile,
+        # Журнал стенда не должен попасть к настоящему боту при его следующем запуске
+        'JOB_JOURNAL_PATH': '',
+    })
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'},
+            'text': text,
+        },
+    }
+
+
+async def sample_rss(samples: List[int], stop: asyncio.Event, interval: float = 1.0):
+    while not stop.is_set():
+        samples.append(descendants_rss())
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args) -> dict:
+    mock = MockMakefilm(args.delay, args.jitter, args.failure_rate, args.image_size, args.image_padding, args.seed)
+    base_url = await mock.start(port=args.mock_port)
+    telegram = FakeTelegramAPI()
+    telegram_url = await telegram.start(port=args.telegram_port)
+    workdir = tempfile.mkdtemp(prefix='makefilm_bench_')
+    configure_environment(args, base_url, workdir)
+
+    import bot_with_storage as bws
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+
+    bot = Bot(bws.TELEGRAM_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_url)))
+    bws.bot = bot
+
+    # Как в main(): прием задач сразу, браузер прогревается в фоне
+    bws.browser_ready = asyncio.Event()
+    await bws.job_queue.start(ready=bws.browser_ready)
+    warmup = asyncio.create_task(bws.warm_up_browser())
+
+    rss_samples: List[int] = []
+    stop_sampling = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(rss_samples, stop_sampling))
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+
+    async def send(i: int):
+        prompt = f"benchmark prompt {i % args.unique_prompts if args.unique_prompts else i}"
+        update = Update.model_validate(make_update(i + 1, 1000 + i, prompt), context={'bot': bot})
+        async with semaphore:
+            started = time.monotonic()
+            await bws.dp.feed_update(bot, update)
+            latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(send(i) for i in range(args.jobs)))
+    elapsed = time.monotonic() - started
+
+    stop_sampling.set()
+    await sampler
+    await warmup
+    await bws.job_queue.stop()
+    await bws.outbound.stop()
+    await bws.close_browser()
+    await bot.session.close()
+    await telegram.stop()
+    await mock.stop()
+
+    delivered = sum(len(times) for times in telegram.photos.values())
+    stages = {}
+    for stage in bws.JOB_STAGES:
+        p50, p95 = bws.metrics.percentiles(stage)
+        if p50 is not None:
+            stages[stage] = {'p50': round(p50, 3), 'p95': round(p95, 3), 'count': bws.metrics.stages[stage].count}
+    return {
+        'jobs': args.jobs,
+        'concurrency': args.concurrency,
+        'workers': args.workers,
+        'network_profile': args.network_profile,
+        'elapsed_seconds': round(elapsed, 2),
+        'delivered_photos': delivered,
+        'jobs_per_minute': round(delivered / elapsed * 60, 2) if elapsed else 0.0,
+        'latency_p50': round(percentile(latencies, 0.5), 3),
+        'latency_p95': round(percentile(latencies, 0.95), 3),
+        'stages': stages,
+        'browser_rss_peak_mb': round(max(rss_samples, default=0) / 1024 / 1024, 1),
+        'browser_rss_avg_mb': round(sum(rss_samples) / len(rss_samples) / 1024 / 1024, 1) if rss_samples else 0.0,
+        'mock_generations': mock.generations,
+        'mock_failures': mock.failures,
+        'telegram_calls': telegram.calls,
+    }
+
+
+def print_report(report: dict):
+    print(f"Задач: {report['jobs']}, одновременно: {report['concurrency']}, воркеров: {report['workers']}, "
+          f"NETWORK_PROFILE: {report['network_profile']}")
+    print(f"Время: {report['elapsed_seconds']} сек, доставлено фото: {report['delivered_photos']}")
+    print(f"Пропускная способность: {report['jobs_per_minute']} задач/мин")
+    print(f"Задержка ответа: p50 {report['latency_p50']} сек, p95 {report['latency_p95']} сек")
+    print("Этапы (p50 / p95, сек):")
+    for stage, values in report['stages'].items():
+        print(f"  {stage:<16} {values['p50']:>8} / {values['p95']:<8} n={values['count']}")
+    print(f"Память браузера: пик {report['browser_rss_peak_mb']} МБ, в среднем {report['browser_rss_avg_mb']} МБ")
+    print(f"Генераций на стенде: {report['mock_generations']}, ошибок: {report['mock_failures']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк бота makefilm.ai")
+    parser.add_argument('--jobs', type=int, default=20, help="сколько промптов отправить")
+    parser.add_argument('--concurrency', type=int, default=5, help="сколько пользователей пишут одновременно")
+    parser.add_argument('--workers', type=int, default=2, help="WORKERS_COUNT бота")
+    parser.add_argument('--unique-prompts', type=int, default=0,
+                        help="число различных промптов (0 — все разные; меньше — проверка кэша и объединения)")
+    parser.add_argument('--timeout', type=int, default=120, help="TIMEOUT_SECONDS бота")
+    parser.add_argument('--delay', type=float, default=5.0, help="длительность генерации на стенде, сек")
+    parser.add_argument('--jitter', type=float, default=1.0, help="разброс длительности генерации, сек")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="доля неудачных генераций")
+    parser.add_argument('--image-size', type=int, default=512)
+    parser.add_argument('--image-padding', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--mock-port', type=int, default=8090)
+    parser.add_argument('--telegram-port', type=int, default=8091)
+    parser.add_argument('--headed', action='store_true', help="показывать окно браузера")
+    parser.add_argument('--network-profile', choices=('on', 'prefs', 'off'), default='prefs',
+                        help="NETWORK_PROFILE бота (сравнение перехвата запросов с HTTP-кэшем)")
+    parser.add_argument('--json', help="сохранить отчет в JSON-файл")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,17 +5,42 @@ Telegram Bot для makefilm.ai с использованием сохранен
 
 import asyncio
 import os
+import re
 import json
 import logging
+import socket
+import time
+from dataclasses import asdict
 from datetime import datetime
-from typing import Optional, Tuple
+from urllib.parse import urljoin, urlparse
+from typing import Dict, List, Optional, Set
 
 from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
-from aiogram.types import Message, FSInputFile
-from playwright.async_api import async_playwright, Browser, BrowserContext, Page
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Chat, Message, BufferedInputFile, FSInputFile, InputMediaPhoto, User
+from playwright.async_api import async_playwright, Browser, Page, Playwright, Response
 from dotenv import load_dotenv
 
+from job_queue import GenerationResult, Job, JobQueue, JobTimeoutError, QueueFullError, QueueStoppedError
+from journal import JobJournal
+from broker import SQLiteJobBroker
+from browser_supervisor import BrowserSupervisor
+from history_cleanup import HistoryCleaner
+from accounts import Account, AccountScheduler, AccountUnavailableError, auth_cookie_expiry, discover_accounts
+from metrics import metrics, start_metrics_server, watch_loop_lag
+from media import MediaStore, close_http_session, download_to_file
+from network_profile import NetworkProfile
+from outbound import PRIORITY_PROGRESS, PRIORITY_REPLY, PRIORITY_RESULT, OutboundScheduler
+from locator_engine import LocatorEngine, LocatorNotFoundError, Strategy
+from page_pool import PagePool
+from procinfo import children, subtree_rss
+from postprocess import ImagePostProcessor
+from progress import ProgressTracker, job_stage
+from webhook import start_webhook_server
+from result_cache import CacheEntry, ResultCache
+
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
@@ -28,94 +53,396 @@ logger = logging.getLogger(__name__)
 
 # Конфигурация из переменных окружения
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
+# Свой сервер Bot API (например, локальный telegram-bot-api или benchmarks/fake_telegram.py)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
 AUTH_STATE_PATH = os.getenv('AUTH_STATE_PATH', 'auth_state.json')
-MAKEFILM_URL = 'https://makefilm.ai/workspace/image-generator'
+# Несколько аккаунтов: список файлов через запятую или каталог с файлами <имя>.json
+AUTH_STATE_PATHS = os.getenv('AUTH_STATE_PATHS', '')
+AUTH_STATES_DIR = os.getenv('AUTH_STATES_DIR', 'auth_states')
+ACCOUNT_COOLDOWN_SECONDS = int(os.getenv('ACCOUNT_COOLDOWN_SECONDS', '600'))
+# Быстрая проверка авторизации при запуске: путь запроса (без редиректов) и таймаут
+AUTH_PROBE_PATH = os.getenv('AUTH_PROBE_PATH', '/workspace/image-generator')
+AUTH_PROBE_TIMEOUT = int(os.getenv('AUTH_PROBE_TIMEOUT', '15'))
+# Запуск браузера без окна (0 — показывать окно, удобно для отладки)
+HEADLESS = os.getenv('HEADLESS', '1') == '1'
+# Плановый перезапуск: контекста аккаунта после N задач, браузера после N задач
+# или при превышении памяти (0 — отключено); период проверки в секундах
+CONTEXT_MAX_JOBS = int(os.getenv('CONTEXT_MAX_JOBS', '200'))
+BROWSER_MAX_JOBS = int(os.getenv('BROWSER_MAX_JOBS', '0'))
+BROWSER_MAX_RSS_MB = int(os.getenv('BROWSER_MAX_RSS_MB', '2048'))
+SUPERVISOR_INTERVAL = int(os.getenv('SUPERVISOR_INTERVAL', '15'))
+# Фоновая очистка истории генераций на сайте (0 — выключена): оставляем
+# HISTORY_KEEP последних, удаляем не больше HISTORY_CLEANUP_BATCH за проход
+HISTORY_CLEANUP_INTERVAL = int(os.getenv('HISTORY_CLEANUP_INTERVAL', '300'))
+HISTORY_KEEP = int(os.getenv('HISTORY_KEEP', '10'))
+HISTORY_CLEANUP_BATCH = int(os.getenv('HISTORY_CLEANUP_BATCH', '20'))
+# Базовый адрес сайта (можно подменить локальным стендом, см. benchmarks/)
+MAKEFILM_BASE_URL = os.getenv('MAKEFILM_BASE_URL', 'https://makefilm.ai').rstrip('/')
+MAKEFILM_URL = f'{MAKEFILM_BASE_URL}/workspace/image-generator'
 TIMEOUT_SECONDS = int(os.getenv('TIMEOUT_SECONDS', '300'))
+WORKERS_COUNT = int(os.getenv('WORKERS_COUNT', '2'))
+QUEUE_MAX_SIZE = int(os.getenv('QUEUE_MAX_SIZE', '50'))
+PAGE_ACQUIRE_TIMEOUT = int(os.getenv('PAGE_ACQUIRE_TIMEOUT', '90'))
+# /batch: промптов в пакете (не больше 10 — размер альбома Telegram), пакетов
+# одного пользователя одновременно и лимит времени на весь пакет
+BATCH_MAX_PROMPTS = min(10, int(os.getenv('BATCH_MAX_PROMPTS', '5')))
+BATCH_PER_USER = int(os.getenv('BATCH_PER_USER', '1'))
+BATCH_TIMEOUT_SECONDS = int(os.getenv('BATCH_TIMEOUT_SECONDS', '600'))
+# Кэш готовых изображений по промпту
+MODEL_VERSION = os.getenv('MODEL_VERSION', 'v1')
+CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+CACHE_TTL_HOURS = int(os.getenv('CACHE_TTL_HOURS', '168'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '500'))
+CACHE_MAX_MB = int(os.getenv('CACHE_MAX_MB', '500'))
+# Страниц генератора на каждый аккаунт (0 — поделить WORKERS_COUNT между аккаунтами)
+PAGE_POOL_SIZE = int(os.getenv('PAGE_POOL_SIZE', '0'))
+# Временные файлы изображений: каталог, лимит на диске и максимальный размер одного файла
+MEDIA_DIR = os.getenv('MEDIA_DIR', '/tmp/makefilm_bot')
+MEDIA_MAX_MB = int(os.getenv('MEDIA_MAX_MB', '500'))
+# Файлы моложе этого срока, сек, по лимиту размера не удаляются (они могут ждать отправки)
+MEDIA_MIN_AGE_SECONDS = float(os.getenv('MEDIA_MIN_AGE_SECONDS', '600'))
+MAX_IMAGE_MB = int(os.getenv('MAX_IMAGE_MB', '50'))
+# Подготовка изображений в отдельных процессах (нужен Pillow, 0 — отправлять как есть):
+# фото уменьшается до PHOTO_MAX_SIDE по длинной стороне и перекодируется без метаданных
+POSTPROCESS_WORKERS = int(os.getenv('POSTPROCESS_WORKERS', '2'))
+PHOTO_MAX_SIDE = int(os.getenv('PHOTO_MAX_SIDE', '2560'))
+PHOTO_QUALITY = int(os.getenv('PHOTO_QUALITY', '85'))
+# Дополнительно присылать оригинал в полном разрешении файлом
+SEND_ORIGINAL_DOCUMENT = os.getenv('SEND_ORIGINAL_DOCUMENT', '0') == '1'
+# Метрики: порт HTTP-эндпоинта /metrics (0 — отключен) и администраторы для /stats
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+ADMIN_IDS = {int(x) for x in os.getenv('ADMIN_IDS', '').split(',') if x.strip()}
+# Лимиты исходящих запросов к Telegram: всего в секунду, на личный чат в секунду
+# (с допустимой пачкой подряд) и на групповой чат в минуту
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '25'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+OUTBOUND_GROUP_PER_MINUTE = float(os.getenv('OUTBOUND_GROUP_PER_MINUTE', '20'))
+# Получение обновлений: polling (по умолчанию) или webhook
+UPDATES_MODE = os.getenv('UPDATES_MODE', 'polling')
+# Webhook: адрес и порт локального сервера, путь, секрет для заголовка
+# X-Telegram-Bot-Api-Secret-Token и публичный адрес для регистрации в Telegram
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+# Как часто обновлять сообщение о прогрессе задачи, сек (0 — не обновлять)
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', '10'))
+# Сохранять скриншоты страницы при сбоях поиска элементов (для отладки селекторов)
+DEBUG_SCREENSHOTS = os.getenv('DEBUG_SCREENSHOTS', '0') == '1'
+# Перехват итогового изображения из сетевого трафика страницы:
+#   off      — не перехватывать, резервно скачивать по <img src>
+#   fallback — если скачать без watermark не удалось, отдать перехваченные байты без повторной загрузки
+#   only     — не скачивать через меню watermark, сразу отдавать перехваченные байты
+NETWORK_CAPTURE = os.getenv('NETWORK_CAPTURE', 'fallback')
+# Регулярное выражение для URL сетевого ответа с итоговым изображением (пусто — только по DOM)
+RESULT_IMAGE_URL_PATTERN = os.getenv('RESULT_IMAGE_URL_PATTERN', '')
+# Отсечение ненужных запросов страниц генератора (шрифты, видео, аналитика, трекеры)
+NETWORK_PROFILE = os.getenv('NETWORK_PROFILE', 'prefs')
+BLOCK_RESOURCE_TYPES = os.getenv('BLOCK_RESOURCE_TYPES', '')
+BLOCK_DOMAINS = os.getenv('BLOCK_DOMAINS', '')
+ALLOW_DOMAINS = os.getenv('ALLOW_DOMAINS', '')
+# Режим процесса:
+#   single   — бот и браузер в одном процессе (по умолчанию)
+#   frontend — только Telegram, задачи уходят воркерам через брокер
+#   worker   — только браузер, задачи берутся из брокера
+BOT_MODE = os.getenv('BOT_MODE', 'single')
+BROKER_PATH = os.getenv('BROKER_PATH', 'jobs.db')
+# Аренда задачи воркером: без heartbeat дольше этого срока задача выдается другому воркеру
+BROKER_LEASE_SECONDS = float(os.getenv('BROKER_LEASE_SECONDS', '30'))
+BROKER_POLL_INTERVAL = float(os.getenv('BROKER_POLL_INTERVAL', '0.5'))
+WORKER_ID = os.getenv('WORKER_ID', '') or f"{socket.gethostname()}:{os.getpid()}"
+
+# Журнал запросов: незавершенные до перезапуска запросы продолжаются после него.
+# Пустой JOB_JOURNAL_PATH отключает журнал.
+JOB_JOURNAL_PATH = os.getenv('JOB_JOURNAL_PATH', 'jobs.jsonl')
+JOURNAL_FLUSH_INTERVAL = float(os.getenv('JOURNAL_FLUSH_INTERVAL', '1'))
+JOURNAL_COMPACT_LINES = int(os.getenv('JOURNAL_COMPACT_LINES', '1000'))
+# resume — выполнить незавершенные запросы заново, report — только сообщить пользователю
+JOURNAL_RECOVERY = os.getenv('JOURNAL_RECOVERY', 'resume')
 
 # Проверяем наличие обязательных переменных
-if not TELEGRAM_TOKEN:
+if BOT_MODE not in ('single', 'frontend', 'worker'):
+    raise ValueError(f"Неизвестный BOT_MODE: {BOT_MODE}")
+if not TELEGRAM_TOKEN and BOT_MODE != 'worker':
     raise ValueError("TELEGRAM_TOKEN не найден в переменных окружения!")
+if JOURNAL_RECOVERY not in ('resume', 'report'):
+    raise ValueError(f"Неизвестный JOURNAL_RECOVERY: {JOURNAL_RECOVERY}")
+if UPDATES_MODE == 'webhook' and not WEBHOOK_SECRET:
+    raise ValueError("Для UPDATES_MODE=webhook задайте WEBHOOK_SECRET!")
 
-# Инициализация бота и диспетчера
-bot = Bot(token=TELEGRAM_TOKEN)
+# Инициализация бота и диспетчера (воркеру Telegram не нужен)
+if BOT_MODE == 'worker':
+    bot = None
+elif TELEGRAM_API_URL:
+    bot = Bot(token=TELEGRAM_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+else:
+    bot = Bot(token=TELEGRAM_TOKEN)
 dp = Dispatcher()
 
+# Брокер задач между фронтендом и воркерами
+broker = SQLiteJobBroker(BROKER_PATH) if BOT_MODE != 'single' else None
+
+# Журнал запросов ведет процесс, принимающий сообщения (воркеру хватает брокера)
+journal = (
+    JobJournal(JOB_JOURNAL_PATH, flush_interval=JOURNAL_FLUSH_INTERVAL, compact_lines=JOURNAL_COMPACT_LINES)
+    if JOB_JOURNAL_PATH and BOT_MODE != 'worker' else None
+)
+
+# Все ответы пользователям идут через планировщик с учетом лимитов Telegram
+outbound = OutboundScheduler(
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    chat_rate=OUTBOUND_CHAT_RATE,
+    chat_burst=OUTBOUND_CHAT_BURST,
+    group_rate=OUTBOUND_GROUP_PER_MINUTE / 60,
+)
+
 # Глобальные переменные для браузера
+playwright: Optional[Playwright] = None
 browser: Optional[Browser] = None
-context: Optional[BrowserContext] = None
+# Устанавливается, когда браузер и аккаунты прогреты; до этого задачи ждут в очереди
+browser_ready: Optional[asyncio.Event] = None
+# Процессы драйвера Playwright (браузер запускается их потомком): только их память
+# учитывается в BROWSER_MAX_RSS_MB, без пула обработки изображений
+playwright_pids: Set[int] = set()
+browser_supervisor: Optional[BrowserSupervisor] = None
+history_cleaner: Optional[HistoryCleaner] = None
+
+# Аккаунты makefilm.ai: у каждого свой контекст браузера и пул страниц
+accounts = discover_accounts(AUTH_STATE_PATHS, AUTH_STATES_DIR, AUTH_STATE_PATH)
+account_scheduler = AccountScheduler(accounts, cooldown=ACCOUNT_COOLDOWN_SECONDS)
+
+media_store = MediaStore(MEDIA_DIR, max_bytes=MEDIA_MAX_MB * 1024 * 1024, min_age=MEDIA_MIN_AGE_SECONDS)
+
+# Обработка изображений перед отправкой (воркеру не нужна — отправляет фронтенд)
+postprocessor = ImagePostProcessor(
+    MEDIA_DIR,
+    workers=POSTPROCESS_WORKERS if BOT_MODE != 'worker' else 0,
+    max_side=PHOTO_MAX_SIDE,
+    quality=PHOTO_QUALITY,
+    keep_original=SEND_ORIGINAL_DOCUMENT,
+)
+
+result_cache = ResultCache(
+    CACHE_DIR,
+    MODEL_VERSION,
+    ttl=CACHE_TTL_HOURS * 3600,
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_MB * 1024 * 1024,
+)
+
+network_profile = (
+    NetworkProfile.from_env(
+        BLOCK_RESOURCE_TYPES, BLOCK_DOMAINS, ALLOW_DOMAINS, RESULT_IMAGE_URL_PATTERN or None,
+        routes=NETWORK_PROFILE != 'prefs',
+    )
+    if NETWORK_PROFILE != 'off' else None
+)
+
+PROMPT_INPUT_SELECTOR = 'body > div > div > div.flex-1.flex.flex-col > main > div > div > div > div.px-8.pt-1 > div > div > div.p-4.pb-12 > textarea'
+# Готовность страницы в пуле: подходит любой вариант из PROMPT_INPUT_STRATEGIES,
+# чтобы поломка точного CSS-пути не оставила пул без страниц
+PROMPT_READY_SELECTOR = f'{PROMPT_INPUT_SELECTOR}, main textarea'
+PROMPT_PANEL_SELECTOR = 'body > div > div > div.flex-1.flex.flex-col > main > div > div > div > div.px-8.pt-1 > div > div'
+GENERATE_BUTTON_SELECTOR = PROMPT_PANEL_SELECTOR + ' > div.absolute.bottom-3.right-4.flex.items-center.gap-3 > button.inline-flex.items-center.justify-center.gap-2.whitespace-nowrap.ring-offset-background.focus-visible\\:outline-none.focus-visible\\:ring-2.focus-visible\\:ring-ring.focus-visible\\:ring-offset-2.disabled\\:pointer-events-none.disabled\\:opacity-50.\\[\\&_svg\\]\\:pointer-events-none.\\[\\&_svg\\]\\:size-4.\\[\\&_svg\\]\\:shrink-0.hover\\:bg-primary\\/90.py-2.px-6.h-8.rounded-lg.bg-gradient-to-r.from-blue-600.via-blue-500.to-blue-400.hover\\:from-blue-700.hover\\:via-blue-600.hover\\:to-blue-500.disabled\\:from-gray-300.disabled\\:to-gray-400.disabled\\:cursor-not-allowed.shadow-lg.hover\\:shadow-xl.transition-all.duration-200.text-white.font-medium.text-sm.border-0'
+DROPDOWN_SELECTOR = "div[role='listbox'], div[role='menu'], .select-content, [data-radix-popper-content-wrapper]"
+
+# Стратегии поиска элементов генератора: точный CSS-путь и более устойчивые запасные варианты
+PROMPT_INPUT_STRATEGIES = [
+    Strategy('css_path', lambda root: root.locator(PROMPT_INPUT_SELECTOR)),
+    Strategy('main_textarea', lambda root: root.locator('main textarea'), delay=0.3),
+]
+V1_BUTTON_STRATEGIES = [
+    Strategy('css_path', lambda root: root.locator(
+        PROMPT_PANEL_SELECTOR + ' > div.absolute.bottom-3.right-4.flex.items-center.gap-3 > div > div > button'
+    )),
+    Strategy('toolbar_popup', lambda root: root.locator(
+        'main div.absolute.bottom-3.right-4 button[aria-haspopup]'
+    ), delay=0.3),
+]
+V1_OPTION_STRATEGIES = [
+    Strategy('dropdown_role', lambda root: root.locator(DROPDOWN_SELECTOR).get_by_role("option", name=r"v1", exact=False)),
+    Strategy('dropdown_text', lambda root: root.locator(DROPDOWN_SELECTOR).locator("text=/v1/i")),
+    Strategy('dropdown_data', lambda root: root.locator(DROPDOWN_SELECTOR).locator(
+        "[data-testid='version-v1'], [data-value='v1'], [data-variant='v1'], button:has-text('v1')"
+    )),
+    # Поиск по всей странице стартует позже, чтобы не перехватить кнопку открытия меню
+    Strategy('page_role', lambda root: root.get_by_role("option", name=r"v1", exact=False), delay=0.5),
+    Strategy('page_text', lambda root: root.locator("text=/v1/i"), delay=1.0),
+]
+GENERATE_BUTTON_STRATEGIES = [
+    Strategy('css_path', lambda root: root.locator(GENERATE_BUTTON_SELECTOR)),
+    Strategy('toolbar_text', lambda root: root.locator(
+        'main div.absolute.bottom-3.right-4 > button:has-text("Generate")'
+    ), delay=0.3),
+]
+# Ищутся внутри карточки результата текущей задачи (см. result_card)
+WATERMARK_MENU_STRATEGIES = [
+    Strategy('radix_id', lambda root: root.locator('[id="radix-:ru:"]')),
+    Strategy('menu_button', lambda root: root.locator('button[aria-haspopup="menu"]'), delay=0.3),
+]
+REMOVE_WATERMARK_STRATEGIES = [
+    Strategy('menuitem_role', lambda root: root.get_by_role("menuitem", name=re.compile("remove watermark", re.I))),
+    Strategy('text', lambda root: root.locator("text=/remove watermark/i")),
+]
+
+locator_engine = LocatorEngine()
+
+
+async def debug_screenshot(page: Page, path: str):
+    """
+    Сохраняет скриншот страницы, если включен DEBUG_SCREENSHOTS
+    """
+    if not DEBUG_SCREENSHOTS:
+        return
+    try:
+        await page.screenshot(path=path)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить скриншот {path}: {e}")
+
+
+async def reset_generator_page(page: Page):
+    """
+    Сбрасывает состояние страницы генератора перед возвратом в пул
+    """
+    await page.keyboard.press('Escape')
+    prompt_input = await locator_engine.resolve('prompt_input', page, PROMPT_INPUT_STRATEGIES, timeout=5)
+    await prompt_input.fill('')
+
+
+async def check_account_auth(account: Account):
+    """
+    Быстрая проверка авторизации аккаунта без отрисовки страниц: срок действия
+    cookies в файле состояния и легкий запрос к генератору без редиректов
+    (неавторизованного пользователя сайт уводит на страницу входа)
+    """
+    host = urlparse(MAKEFILM_BASE_URL).hostname or ''
+    expiry = auth_cookie_expiry(account.state_path, host)
+    if expiry is None:
+        logger.warning(f"⚠️ [{account.name}] В {account.state_path} нет cookies для {host}")
+    elif expiry < time.time():
+        error = AccountUnavailableError(
+            f"cookies истекли {datetime.fromtimestamp(expiry):%Y-%m-%d %H:%M}", reason='auth'
+        )
+        account_scheduler.mark_unavailable(account, error)
+        logger.warning(f"🔄 Обновите состояние: python3 save_auth_state.py --account {account.name}")
+        return
+
+    with metrics.span('auth_probe'):
+        try:
+            response = await account.context.request.get(
+                MAKEFILM_BASE_URL + AUTH_PROBE_PATH,
+                max_redirects=0,
+                timeout=AUTH_PROBE_TIMEOUT * 1000,
+            )
+        except Exception as e:
+            # Сеть недоступна — не выводим аккаунт из ротации, задачи сами обнаружат проблему
+            logger.warning(f"⚠️ [{account.name}] Проверка авторизации не удалась (продолжаем): {e}")
+            return
+
+    location = response.headers.get('location', '')
+    if response.status in (401, 403) or (300 <= response.status < 400 and LOGIN_URL_RE.search(location)):
+        error = AccountUnavailableError(f"сайт требует вход (HTTP {response.status} {location})".strip(), reason='auth')
+        account_scheduler.mark_unavailable(account, error)
+        logger.warning(f"🔄 Обновите состояние: python3 save_auth_state.py --account {account.name}")
+    else:
+        logger.info(f"✅ [{account.name}] Авторизация подтверждена (HTTP {response.status})")
+
+
+async def init_account(account: Account, pool_size: int):
+    """
+    Создает изолированный контекст аккаунта и пул страниц генератора
+    """
+    # Создаем контекст с сохраненным состоянием авторизации
+    account.context = await browser.new_context(
+        storage_state=account.state_path,
+        user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:120.0) Gecko/20100101 Firefox/120.0'
+    )
+
+    # Увеличиваем таймауты по умолчанию для медленных сетей
+    account.context.set_default_timeout(60000)
+
+    if network_profile:
+        await network_profile.apply(account.context)
+
+    logger.info(f"✅ Контекст аккаунта {account.name} создан из {account.state_path}")
+
+    # Проверяем авторизацию (не фейлим весь запуск при таймауте)
+    await check_account_auth(account)
+
+    # Заранее открываем страницы генератора для воркеров
+    account.pool = PagePool(
+        account.context,
+        MAKEFILM_URL,
+        PROMPT_READY_SELECTOR,
+        size=pool_size,
+        reset=reset_generator_page,
+    )
+    await account.pool.start()
+
+
+def account_pool_size() -> int:
+    """
+    Страниц генератора на аккаунт: по умолчанию делим воркеры между аккаунтами поровну
+    """
+    available = [account for account in accounts if os.path.exists(account.state_path)]
+    return PAGE_POOL_SIZE or max(1, -(-WORKERS_COUNT // max(1, len(available))))
+
+
+async def reopen_account(account: Account):
+    """
+    Пересоздает контекст аккаунта (для планового перезапуска)
+    """
+    await init_account(account, account_pool_size())
+
+
+async def restart_browser():
+    """
+    Закрывает браузер со всеми контекстами и запускает заново
+    """
+    await close_browser()
+    await init_browser()
 
 
 async def init_browser():
     """
-    Инициализирует браузер с сохраненным состоянием авторизации
+    Инициализирует браузер и контексты всех аккаунтов с сохраненным состоянием авторизации
     """
-    global browser, context
+    global browser, playwright
     
     try:
+        before = set(children(os.getpid()))
         playwright = await async_playwright().start()
+        playwright_pids.clear()
+        playwright_pids.update(set(children(os.getpid())) - before)
         
-        # Проверяем наличие файла состояния авторизации
-        if not os.path.exists(AUTH_STATE_PATH):
-            logger.error(f"Файл состояния авторизации не найден: {AUTH_STATE_PATH}")
+        # Проверяем наличие файлов состояния авторизации
+        available = [account for account in accounts if os.path.exists(account.state_path)]
+        for account in accounts:
+            if account not in available:
+                logger.error(f"Файл состояния авторизации не найден: {account.state_path}")
+        if not available:
             logger.error("Запустите сначала: python3 save_auth_state.py")
-            raise FileNotFoundError(f"Файл {AUTH_STATE_PATH} не найден!")
+            raise FileNotFoundError("Не найдено ни одного файла состояния авторизации!")
         
         # Запускаем браузер
         browser = await playwright.firefox.launch(
-            headless=False,  # Можно изменить на True для скрытого режима
-            args=['--no-sandbox']
+            headless=HEADLESS,
+            args=['--no-sandbox'],
+            firefox_user_prefs=network_profile.firefox_prefs() if network_profile else None,
         )
+        if browser_supervisor:
+            browser.on('disconnected', lambda _: browser_supervisor.notify_disconnected())
+        logger.info(f"✅ Браузер запущен, аккаунтов makefilm.ai: {len(available)}")
 
-        # Создаем контекст с сохраненным состоянием авторизации
-        context = await browser.new_context(
-            storage_state=AUTH_STATE_PATH,
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:120.0) Gecko/20100101 Firefox/120.0'
-        )
-
-        # Увеличиваем таймауты по умолчанию для медленных сетей
-        context.set_default_timeout(60000)
-
-        logger.info(f"✅ Браузер инициализирован с состоянием авторизации из {AUTH_STATE_PATH}")
-
-        # Проверяем авторизацию (не фейлим весь запуск при таймауте)
-        page = await context.new_page()
-        page.set_default_navigation_timeout(60000)
-        try:
-            try:
-                await page.goto("https://makefilm.ai", wait_until='networkidle', timeout=45000)
-            except Exception:
-                # Фолбек — более мягкое ожидание
-                await page.goto("https://makefilm.ai", wait_until='domcontentloaded', timeout=45000)
-            await page.wait_for_load_state('domcontentloaded')
-        except Exception as nav_err:
-            logger.warning(f"Не удалось полноценно открыть главную страницу (продолжаем): {nav_err}")
-            # Не поднимаем ошибку, т.к. дальше можем сразу перейти в генератор
-        
-        # Проверяем индикаторы авторизации
-        auth_indicators = [
-            'a[href*="workspace"]',
-            'a[href*="profile"]',
-            'button:has-text("Logout")',
-            '.user-menu',
-            '[data-testid="user-menu"]'
-        ]
-        
-        is_authenticated = False
-        for indicator in auth_indicators:
+        pool_size = account_pool_size()
+        for account in available:
             try:
-                element = await page.query_selector(indicator)
-                if element:
-                    is_authenticated = True
-                    logger.info(f"✅ Авторизация подтверждена: {indicator}")
-                    break
-            except:
-                continue
-        
-        if not is_authenticated:
-            logger.warning("⚠️ Авторизация не обнаружена, возможно, состояние устарело")
-            logger.warning("🔄 Попробуйте обновить состояние: python3 save_auth_state.py")
-
-        await page.close()
+                await init_account(account, pool_size)
+            except Exception as e:
+                logger.error(f"Ошибка при инициализации аккаунта {account.name}: {e}")
 
     except Exception as e:
         # Не прерываем запуск бота полностью — позволим обработчикам попытаться перейти на нужную страницу
@@ -127,16 +454,23 @@ async def close_browser():
     """
     Закрывает браузер
     """
-    global browser, context
+    global browser, playwright
     
     try:
-        if context:
-            await context.close()
-            context = None
+        for account in accounts:
+            if account.pool:
+                await account.pool.stop()
+                account.pool = None
+            if account.context:
+                await account.context.close()
+                account.context = None
             
         if browser:
             await browser.close()
             browser = None
+        if playwright:
+            await playwright.stop()
+            playwright = None
             
         logger.info("Браузер закрыт")
         
@@ -144,183 +478,580 @@ async def close_browser():
         logger.error(f"Ошибка при закрытии браузера: {e}")
 
 
-async def process_makefilm_request(prompt: str) -> Tuple[str, Optional[str], Optional[str]]:
-    if not context:
-        raise Exception("Браузер не инициализирован")
-    page = None
-    result_url = None
-    img_src = None
-    file_path = None
+async def warm_up_browser():
+    """
+    Прогревает браузер и аккаунты в фоне, пока бот уже принимает сообщения
+    """
     try:
-        page = await context.new_page()
-        await page.goto(MAKEFILM_URL, wait_until='networkidle')
-        await page.wait_for_timeout(3000)
-        # await asyncio.sleep(60)  # Удаляю эту строку, чтоб промпт водился сразу
-        # 1. Явный поиск и ввод промпта
-        prompt_input_selector = 'body > div > div > div.flex-1.flex.flex-col > main > div > div > div > div.px-8.pt-1 > div > div > div.p-4.pb-12 > textarea'
-        logger.info('Ищу поле для ввода промпта...')
-        try:
-            await page.wait_for_selector(prompt_input_selector, timeout=15000)
-            prompt_input = await page.query_selector(prompt_input_selector)
-            if not prompt_input:
-                logger.error('Поле для текста промпта не найдено (None)')
-                raise Exception('Не найдено поле для промпта!')
-            await prompt_input.focus()
-            await prompt_input.fill("")
-            await page.keyboard.type(prompt, delay=70)
-            await prompt_input.dispatch_event('input')
-            await prompt_input.dispatch_event('change')
-            logger.info(f"Промпт введен: {prompt}")
-        except Exception as e:
-            logger.error(f'Ошибка при поиске/вводе промпта: {e}')
-            raise
-
-        # 2. Выбор V1 (как есть, после ввода)
-        logger.info('Перед выбором V1...')
-        v1_button_selector = 'body > div > div > div.flex-1.flex.flex-col > main > div > div > div > div.px-8.pt-1 > div > div > div.absolute.bottom-3.right-4.flex.items-center.gap-3 > div > div > button'
-        v1_btn = page.locator(v1_button_selector).first
-        picked = False
-        try:
-            await v1_btn.wait_for(timeout=8000)
-            await v1_btn.scroll_into_view_if_needed()
-            await v1_btn.click()
-            await page.wait_for_timeout(300)
-            dropdown_candidates = [
-                "div[role='listbox']",
-                "div[role='menu']",
-                ".select-content",
-                "[data-radix-popper-content-wrapper]"
-            ]
-            dropdown = None
-            for candidate in dropdown_candidates:
-                try:
-                    dropdown = page.locator(candidate).first
-                    await dropdown.wait_for(timeout=2000)
-                    break
-                except: continue
-            if dropdown:
-                try:
-                    opt = dropdown.get_by_role("option", name=r"v1", exact=False)
-                    if await opt.count() > 0:
-                        await opt.first.scroll_into_view_if_needed()
-                        await opt.first.click()
-                        picked = True
-                        logger.info("V1 pick: via role/option inside dropdown")
-                except: pass
-            if dropdown and not picked:
-                try:
-                    opt_text = dropdown.locator("text=/v1/i").first
-                    await opt_text.wait_for(timeout=1000)
-                    await opt_text.click()
-                    picked = True
-                    logger.info("V1 pick: via visible text inside dropdown")
-                except: pass
-            if dropdown and not picked:
-                for sel in ["[data-testid='version-v1']", "[data-value='v1']", "[data-variant='v1']", "button:has-text('v1')"]:
-                    try:
-                        el = dropdown.locator(sel).first
-                        await el.wait_for(timeout=1000)
-                        await el.click()
-                        picked = True
-                        logger.info(f"V1 pick: via {sel} plastic inside dropdown")
-                        break
-                    except: continue
-            if not picked:
-                try:
-                    opt = page.get_by_role("option", name=r"v1", exact=False)
-                    if await opt.count() > 0:
-                        await opt.first.scroll_into_view_if_needed()
-                        await opt.first.click()
-                        picked = True
-                        logger.info("V1 pick: fallback to whole page by role/option")
-                except: pass
-            if not picked:
-                try:
-                    opt_text = page.locator("text=/v1/i").first
-                    await opt_text.wait_for(timeout=1000)
-                    await opt_text.click()
-                    picked = True
-                    logger.info("V1 pick: fallback to whole page by visible text")
-                except: pass
-            if not picked:
-                try:
-                    await page.keyboard.type('v')
-                    await page.keyboard.press('Enter')
-                    picked = True
-                    logger.info("V1 pick: fallback by keyboard")
-                except: pass
-            if not picked:
-                logger.warning('V1 модель по меню НЕ выбрана (выполнен весь набор стратегий). См. скрин.')
-                await page.screenshot(path='v1_failed.png')
-            else:
-                logger.info("V1 модель выбрана успешно")
-        except Exception as e:
-            logger.warning(f'Выбор V1 модели не удался: {e}')
-            try:
-                await page.screenshot(path='v1_error.png')
-            except: pass
+        with metrics.span('browser_startup'):
+            await init_browser()
+    finally:
+        # Даже при ошибке запуска отпускаем воркеры: задачи завершатся понятной ошибкой, а не зависнут
+        browser_ready.set()
+        logger.info("✅ Браузер готов, воркеры начали брать задачи")
+        if browser_supervisor:
+            browser_supervisor.start()
+        if history_cleaner:
+            history_cleaner.start()
 
-        # 3. Клик по кнопке Generate и НАЧАЛО ожидания результата
-        generate_button_selector = 'body > div > div > div.flex-1.flex.flex-col > main > div > div > div > div.px-8.pt-1 > div > div > div.absolute.bottom-3.right-4.flex.items-center.gap-3 > button.inline-flex.items-center.justify-center.gap-2.whitespace-nowrap.ring-offset-background.focus-visible\\:outline-none.focus-visible\\:ring-2.focus-visible\\:ring-ring.focus-visible\\:ring-offset-2.disabled\\:pointer-events-none.disabled\\:opacity-50.\\[\\&_svg\\]\\:pointer-events-none.\\[\\&_svg\\]\\:size-4.\\[\\&_svg\\]\\:shrink-0.hover\\:bg-primary\\/90.py-2.px-6.h-8.rounded-lg.bg-gradient-to-r.from-blue-600.via-blue-500.to-blue-400.hover\\:from-blue-700.hover\\:via-blue-600.hover\\:to-blue-500.disabled\\:from-gray-300.disabled\\:to-gray-400.disabled\\:cursor-not-allowed.shadow-lg.hover\\:shadow-xl.transition-all.duration-200.text-white.font-medium.text-sm.border-0'
-        try:
-            logger.info('Перед поиском кнопки Generate...')
-            await page.wait_for_selector(generate_button_selector, timeout=15000)
-            generate_button = await page.query_selector(generate_button_selector)
-            if not generate_button:
-                logger.error('Кнопка генерации не найдена (None)')
-                raise Exception('Кнопка генерации не найдена!')
-            await generate_button.scroll_into_view_if_needed()
-            await generate_button.hover(timeout=1500)
-            await generate_button.click()
-            logger.info("Кнопка Generate нажата. Ждем появления итогового изображения...")
-        except Exception as e:
-            logger.error(f"Ошибка при поиске/клике по кнопке генерации: {e}")
-            raise
-
-        # После клика по кнопке Generate ждем 2 минуты
-        await page.wait_for_timeout(120000)  # 2 минуты
-        final_img_selector = 'img[alt="Generated image"]'
-        logger.info("Ожидание появления итогового <img> после старта генерации...")
-        img_src = None
-        for i in range(300):
+
+FINAL_IMG_SELECTOR = 'img[alt="Generated image"]'
+
+# Ждет появления нового <img> с итоговым изображением через MutationObserver,
+# без периодического опроса страницы из Python
+_WAIT_GENERATED_IMAGE_JS = """
+([selector, known, timeoutMs]) => new Promise((resolve) => {
+    const pick = () => {
+        for (const img of document.querySelectorAll(selector)) {
+            const src = img.getAttribute('src');
+            if (src && !src.includes('thumb') && !known.includes(src)) return src;
+        }
+        return null;
+    };
+    const found = pick();
+    if (found) return resolve(found);
+    const observer = new MutationObserver(() => {
+        const src = pick();
+        if (src) {
+            observer.disconnect();
+            resolve(src);
+        }
+    });
+    observer.observe(document.body, {
+        childList: true, subtree: true, attributes: true, attributeFilter: ['src', 'alt']
+    });
+    // Снимаем наблюдатель по таймауту, чтобы он не оставался на странице
+    setTimeout(() => {
+        observer.disconnect();
+        resolve(null);
+    }, timeoutMs);
+})
+"""
+
+
+async def collect_generated_srcs(page: Page) -> list:
+    """
+    Возвращает src уже показанных на странице итоговых изображений
+    """
+    try:
+        return await page.eval_on_selector_all(
+            FINAL_IMG_SELECTOR, "imgs => imgs.map(img => img.getAttribute('src')).filter(Boolean)"
+        )
+    except Exception:
+        return []
+
+
+async def wait_for_generated_image(page: Page, known_srcs: list, timeout: float) -> Optional[str]:
+    """
+    Ждет итоговое изображение по сигналам страницы: мутация DOM с новым <img>
+    или сетевой ответ с картинкой (если задан RESULT_IMAGE_URL_PATTERN).
+    Возвращает src изображения или None по истечении timeout (в секундах).
+    Если все сигналы оборвались раньше (например, страница ушла на другой
+    адрес), поднимает исключение с причиной.
+    """
+    if timeout <= 0:
+        return None
+    waiters = [asyncio.ensure_future(
+        page.evaluate(_WAIT_GENERATED_IMAGE_JS, [FINAL_IMG_SELECTOR, known_srcs, int(timeout * 1000)])
+    )]
+    if RESULT_IMAGE_URL_PATTERN:
+        pattern = re.compile(RESULT_IMAGE_URL_PATTERN)
+
+        def is_result_image(response) -> bool:
+            return (
+                response.ok
+                and response.request.resource_type == 'image'
+                and 'thumb' not in response.url
+                and response.url not in known_srcs
+                and bool(pattern.search(response.url))
+            )
+
+        waiters.append(asyncio.ensure_future(
+            page.wait_for_event('response', predicate=is_result_image, timeout=timeout * 1000)
+        ))
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + timeout
+    pending = set(waiters)
+    error = None
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception():
+                    error = task.exception()
+                    logger.info(f'Сигнал завершения генерации недоступен: {error}')
+                    continue
+                result = task.result()
+                if result is None:
+                    continue
+                # wait_for_event возвращает Response, evaluate — src из DOM
+                return result if isinstance(result, str) else result.url
+        if error and not pending and loop.time() < deadline:
+            raise Exception(f"Ожидание изображения прервано через {loop.time() - started:.0f} сек: {error}")
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+# Признаки того, что аккаунт не может генерировать: редирект на вход или исчерпанная квота
+LOGIN_URL_RE = re.compile(r'/(login|sign-?in|sign-?up|auth)\b', re.IGNORECASE)
+QUOTA_TEXT_SELECTOR = "text=/(insufficient|not enough|out of) credits|quota exceeded|limit reached|upgrade your plan/i"
+
+
+async def detect_account_failure(page: Page) -> Optional[AccountUnavailableError]:
+    """
+    Проверяет страницу на признаки слетевшей авторизации или исчерпанной квоты
+    """
+    if LOGIN_URL_RE.search(page.url):
+        return AccountUnavailableError(f"редирект на страницу входа: {page.url}", reason='auth')
+    try:
+        if await page.locator(QUOTA_TEXT_SELECTOR).count() > 0:
+            return AccountUnavailableError("закончились кредиты генерации", reason='quota')
+    except Exception:
+        pass
+    return None
+
+
+class ImageResponseCapture:
+    """
+    Запоминает сетевые ответы с изображениями, пока страница их загружает,
+    чтобы отдать байты итогового изображения без повторного скачивания
+    """
+
+    def __init__(self, page: Page, known_srcs: list):
+        self.page = page
+        self.known_srcs = set(known_srcs)
+        self.responses: Dict[str, Response] = {}
+
+    def _on_response(self, response: Response):
+        if response.ok and response.request.resource_type == 'image' and response.url not in self.known_srcs:
+            self.responses[response.url] = response
+
+    def __enter__(self):
+        self.page.on('response', self._on_response)
+        return self
+
+    def __exit__(self, *exc):
+        # Страница вернется в пул — снимаем обработчик
+        self.page.remove_listener('response', self._on_response)
+        self.responses.clear()
+
+    async def body_for(self, src: str, timeout: float = 10.0) -> Optional[bytes]:
+        """
+        Возвращает байты ответа для src; если ответ еще не пришел, ждет его не дольше timeout
+        """
+        url = urljoin(self.page.url, src)
+        response = self.responses.get(url)
+        if response is None:
             try:
-                img = await page.query_selector(final_img_selector)
-                src = await img.get_attribute('src') if img else None
-                if img and src and 'thumb' not in src:
-                    img_src = src
-                    logger.info(f'Готовое фото найдено: {src}')
-                    break
+                response = await self.page.wait_for_event(
+                    'response', predicate=lambda r: r.url == url and r.ok, timeout=timeout * 1000
+                )
             except Exception as e:
-                logger.info(f'wait img error: {e}')
-            await page.wait_for_timeout(1000)
-        else:
-            logger.warning('Финальное фото не появилось, продолжаем без него.')
-        # Remove watermark и download
-        menu_selector = "#radix-:ru:"
-        remove_selector = "text=/remove watermark/i"
+                logger.info(f"Ответ с изображением не перехвачен: {e}")
+                return None
         try:
-            logger.info("Ожидаю меню watermark...")
-            await page.wait_for_selector(menu_selector, timeout=8000)
-            await page.click(menu_selector)
-            await page.wait_for_timeout(350)
-            logger.info("Ожидаю Remove watermark...")
-            await page.wait_for_selector(remove_selector, timeout=5000)
-            async with page.expect_download(timeout=15000) as download_info:
-                await page.click(remove_selector)
-            download = await download_info.value
-            file_path = os.path.join("/tmp", f"nofilter_{download.suggested_filename}")
-            await download.save_as(file_path)
-            logger.info(f"Фото без watermark скачано: {file_path}")
+            return await response.body()
         except Exception as e:
-            logger.warning(f"Remove watermark/download fail: {e}")
-            file_path = None
-        return result_url, img_src, file_path
+            logger.warning(f"Не удалось прочитать тело ответа с изображением: {e}")
+            return None
+
+
+def result_card(page: Page, img_src: str):
+    """
+    Карточка результата с изображением img_src: ближайший общий контейнер
+    изображения и кнопки меню. На странице из пула могут оставаться карточки
+    прошлых задач — их меню трогать нельзя.
+    """
+    escaped = img_src.replace('\\', '\\\\').replace('"', '\\"')
+    return (
+        page.locator('div', has=page.locator(f'img[src="{escaped}"]'))
+        .filter(has=page.locator('button[aria-haspopup="menu"]'))
+        .last
+    )
+
+
+async def download_without_watermark(page: Page, job: Job, img_src: str) -> Optional[str]:
+    """
+    Скачивает итоговое изображение без watermark через меню карточки результата img_src
+    """
+    try:
+        logger.info("Ожидаю меню watermark...")
+        menu = await locator_engine.resolve(
+            'watermark_menu', result_card(page, img_src), WATERMARK_MENU_STRATEGIES, timeout=job.remaining(8)
+        )
+        await menu.click()
+        logger.info("Ожидаю Remove watermark...")
+        remove_item = await locator_engine.resolve(
+            'remove_watermark', page, REMOVE_WATERMARK_STRATEGIES, timeout=job.remaining(5)
+        )
+        async with page.expect_download(timeout=job.remaining_ms(15)) as download_info:
+            await remove_item.click()
+        download = await download_info.value
+        suffix = os.path.splitext(download.suggested_filename)[1] or '.jpg'
+        file_path = media_store.new_path(suffix=suffix, prefix='nofilter_')
+        await download.save_as(file_path)
+        logger.info(f"Фото без watermark скачано: {file_path}")
+        return file_path
+    except Exception as e:
+        logger.warning(f"Remove watermark/download fail: {e}")
+        return None
+
+
+async def acquire_generator_page(page_pool: PagePool, job: Job) -> Page:
+    """
+    Берет страницу генератора из пула аккаунта с учетом дедлайна задачи
+    """
+    try:
+        page = await page_pool.acquire(timeout=job.remaining(PAGE_ACQUIRE_TIMEOUT))
+    except asyncio.TimeoutError:
+        if page_pool.last_error_url and LOGIN_URL_RE.search(page_pool.last_error_url):
+            raise AccountUnavailableError(
+                f"страница генератора перенаправляет на вход: {page_pool.last_error_url}", reason='auth'
+            )
+        raise Exception(f"Нет готовой страницы генератора за {PAGE_ACQUIRE_TIMEOUT} сек")
+    # Остальные действия на странице (fill, click, ...) тоже не переживут дедлайн задачи
+    page.set_default_timeout(max(1.0, job.remaining()) * 1000)
+    return page
+
+
+async def enter_prompt(page: Page, prompt: str, job: Job):
+    """
+    Вводит промпт в поле генератора
+    """
+    logger.info('Ищу поле для ввода промпта...')
+    try:
+        prompt_input = await locator_engine.resolve(
+            'prompt_input', page, PROMPT_INPUT_STRATEGIES, timeout=job.remaining(15)
+        )
+        await prompt_input.focus()
+        await prompt_input.fill("")
+        await page.keyboard.type(prompt, delay=70)
+        await prompt_input.dispatch_event('input')
+        await prompt_input.dispatch_event('change')
+        logger.info(f"Промпт введен: {prompt}")
+    except Exception as e:
+        logger.error(f'Ошибка при поиске/вводе промпта: {e}')
+        raise
+
+
+async def pick_v1_model(page: Page, job: Job):
+    """
+    Открывает меню моделей и выбирает V1; неудача не прерывает генерацию
+    """
+    logger.info('Перед выбором V1...')
+    try:
+        v1_btn = await locator_engine.resolve('v1_button', page, V1_BUTTON_STRATEGIES, timeout=job.remaining(8))
+        await v1_btn.scroll_into_view_if_needed()
+        await v1_btn.click()
+        try:
+            v1_option = await locator_engine.resolve(
+                'v1_option', page, V1_OPTION_STRATEGIES, timeout=job.remaining(3)
+            )
+            await v1_option.scroll_into_view_if_needed()
+            await v1_option.click()
+        except LocatorNotFoundError:
+            # Последний вариант — выбор с клавиатуры в открытом меню
+            await page.keyboard.type('v')
+            await page.keyboard.press('Enter')
+            logger.info("V1 pick: fallback by keyboard")
+        logger.info("V1 модель выбрана успешно")
+    except Exception as e:
+        logger.warning(f'Выбор V1 модели не удался: {e}')
+        await debug_screenshot(page, 'v1_failed.png')
+
+
+async def click_generate(page: Page, job: Job) -> list:
+    """
+    Нажимает Generate и возвращает src изображений, бывших на странице до клика
+    """
+    try:
+        logger.info('Перед поиском кнопки Generate...')
+        generate_button = await locator_engine.resolve(
+            'generate_button', page, GENERATE_BUTTON_STRATEGIES, timeout=job.remaining(15)
+        )
+        await generate_button.scroll_into_view_if_needed()
+        await generate_button.hover(timeout=job.remaining_ms(1.5))
+        known_srcs = await collect_generated_srcs(page)
+        await generate_button.click()
+        logger.info("Кнопка Generate нажата. Ждем появления итогового изображения...")
+        return known_srcs
+    except Exception as e:
+        logger.error(f"Ошибка при поиске/клике по кнопке генерации: {e}")
+        raise
+
+
+async def process_makefilm_request(job: Job, account: Account) -> GenerationResult:
+    """
+    Генерирует изображение по промпту задачи на странице аккаунта.
+    Все ожидания ограничены дедлайном задачи; при отмене страница пересоздается.
+    """
+    if not account.ready:
+        raise Exception("Браузер не инициализирован")
+    prompt = job.prompt
+    page_pool = account.pool
+    page = None
+    page_reusable = False
+    result = GenerationResult()
+    try:
+        # Берем из пула уже загруженную страницу генератора
+        with job_stage(job, 'page_acquire'):
+            page = await acquire_generator_page(page_pool, job)
+        # 1. Поиск и ввод промпта
+        with job_stage(job, 'prompt_input'):
+            await enter_prompt(page, prompt, job)
+
+        # 2. Выбор V1 (после ввода): открываем меню моделей и выбираем пункт v1
+        with job_stage(job, 'v1_pick'):
+            await pick_v1_model(page, job)
+
+        # 3. Клик по кнопке Generate и НАЧАЛО ожидания результата
+        with job_stage(job, 'generate_click'):
+            known_srcs = await click_generate(page, job)
+
+        with ImageResponseCapture(page, known_srcs) as capture:
+            # Ждем сигнал готовности от страницы, но не дольше дедлайна задачи
+            logger.info("Ожидание появления итогового <img> после старта генерации...")
+            with job_stage(job, 'completion_wait'):
+                wait_started = time.monotonic()
+                result.img_src = await wait_for_generated_image(page, known_srcs, job.remaining())
+                if result.img_src:
+                    logger.info(f'Готовое фото найдено: {result.img_src}')
+                else:
+                    failure = await detect_account_failure(page)
+                    if failure:
+                        raise failure
+                    raise JobTimeoutError(
+                        f"Изображение не появилось за {time.monotonic() - wait_started:.0f} сек ожидания"
+                    )
+            with job_stage(job, 'download'):
+                # Без нового изображения скачивать нечего: меню осталось бы только у карточек прошлых задач
+                if NETWORK_CAPTURE != 'only' and result.img_src:
+                    result.file_path = await download_without_watermark(page, job, result.img_src)
+                if not result.file_path and result.img_src and NETWORK_CAPTURE != 'off':
+                    result.image_bytes = await capture.body_for(result.img_src)
+                    if result.image_bytes:
+                        result.image_name = os.path.basename(urlparse(result.img_src).path) or 'image.jpg'
+                        logger.info(f"Изображение взято из сетевого ответа страницы ({len(result.image_bytes)} байт)")
+        page_reusable = True
+        return result
+    except AccountUnavailableError:
+        # Пробрасываем, чтобы планировщик вывел аккаунт из ротации
+        raise
     except Exception as e:
         logger.error(f"Ошибка при обработке запроса: {e}")
-        return None, None, None
+        if page:
+            failure = await detect_account_failure(page)
+            if failure:
+                raise failure
+        # Без изображения отвечать нечем — пользователь получит сообщение об ошибке
+        raise
     finally:
         if page:
-            await page.close()
+            # После ошибки или отмены страница может быть в непредсказуемом состоянии — пересоздаем её
+            if page_reusable:
+                page.set_default_timeout(60000)
+            await page_pool.release(page, reusable=page_reusable)
+
+
+async def process_makefilm_batch(job: Job, account: Account) -> List[GenerationResult]:
+    """
+    Генерирует изображения по всем промптам пакета на одной странице: промпты
+    отправляются подряд, не дожидаясь результатов (генерации идут на сайте
+    параллельно), V1 выбирается один раз. Изображения собираются по мере
+    готовности; байты берутся из сетевых ответов страницы.
+    """
+    if not account.ready:
+        raise Exception("Браузер не инициализирован")
+    page_pool = account.pool
+    page = None
+    page_reusable = False
+    results: List[GenerationResult] = []
+    try:
+        with job_stage(job, 'page_acquire'):
+            page = await acquire_generator_page(page_pool, job)
+        known_srcs = await collect_generated_srcs(page)
+        with ImageResponseCapture(page, known_srcs) as capture:
+            for index, prompt in enumerate(job.batch):
+                with job_stage(job, 'prompt_input'):
+                    await enter_prompt(page, prompt, job)
+                if index == 0:
+                    with job_stage(job, 'v1_pick'):
+                        await pick_v1_model(page, job)
+                with job_stage(job, 'generate_click'):
+                    await click_generate(page, job)
+            logger.info(f"Пакет #{job.id}: отправлено промптов {len(job.batch)}, ждем результаты...")
+            with job_stage(job, 'completion_wait'):
+                wait_started = time.monotonic()
+                while len(results) < len(job.batch):
+                    img_src = await wait_for_generated_image(page, known_srcs, job.remaining())
+                    if not img_src:
+                        break
+                    known_srcs.append(img_src)
+                    result = GenerationResult(img_src=img_src)
+                    if NETWORK_CAPTURE != 'off':
+                        result.image_bytes = await capture.body_for(img_src)
+                        if result.image_bytes:
+                            result.image_name = os.path.basename(urlparse(img_src).path) or 'image.jpg'
+                    results.append(result)
+                    logger.info(f"Пакет #{job.id}: готово {len(results)} из {len(job.batch)}")
+        if not results:
+            failure = await detect_account_failure(page)
+            if failure:
+                raise failure
+            raise Exception(
+                f"Ни одно изображение пакета не появилось за {time.monotonic() - wait_started:.0f} сек ожидания"
+            )
+        page_reusable = True
+        return results
+    except AccountUnavailableError:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при обработке пакета #{job.id}: {e}")
+        if page:
+            failure = await detect_account_failure(page)
+            if failure:
+                raise failure
+        # Уже готовые изображения отдаем, даже если остальные не получены
+        if results:
+            return results
+        raise
+    finally:
+        if page:
+            if page_reusable:
+                page.set_default_timeout(60000)
+            await page_pool.release(page, reusable=page_reusable)
+
+
+def journal_job(job: Job, event: str, **fields):
+    """
+    Записывает событие задачи в журнал для каждого ожидающего её запроса
+    """
+    if journal:
+        for request_id in job.journal_ids:
+            journal.record(request_id, event, **fields)
+
+
+async def run_generation_job(job: Job) -> GenerationResult:
+    """
+    Выполняет задачу генерации в воркере очереди
+    """
+    logger.info(f"Обработка запроса #{job.id} от пользователя {job.user_id}: {job.prompt}")
+    metrics.observe('queue_wait', job.started_at - job.created_at)
+    journal_job(job, 'started')
+    tried = []
+    try:
+        while True:
+            # Направляем задачу на наименее загруженный исправный аккаунт
+            account = await account_scheduler.acquire(timeout=job.remaining(TIMEOUT_SECONDS), exclude=tried)
+            try:
+                logger.info(f"Задача #{job.id} выполняется на аккаунте {account.name}")
+                if job.batch:
+                    result = await process_makefilm_batch(job, account)
+                else:
+                    result = await process_makefilm_request(job, account)
+                break
+            except AccountUnavailableError as e:
+                account_scheduler.mark_unavailable(account, e)
+                metrics.inc('account_failures_total', account=account.name, reason=e.reason)
+                tried.append(account)
+            finally:
+                account_scheduler.release(account)
+    except asyncio.CancelledError:
+        metrics.inc('jobs_total', outcome='cancelled')
+        raise
+    except Exception:
+        metrics.inc('jobs_total', outcome='failure')
+        raise
+    results = result if isinstance(result, list) else [result]
+    success = any(r.file_path or r.image_bytes or r.img_src for r in results)
+    metrics.inc('jobs_total', outcome='success' if success else 'failure')
+    return result
+
+
+async def run_brokered_job(job: Job) -> GenerationResult:
+    """
+    Передает задачу воркерам через брокер и ждет её результат (режим frontend)
+    """
+    broker_id = await broker.submit(job.prompt, job.user_id, job.chat_id)
+    logger.info(f"Задача #{job.id} передана воркерам (в брокере #{broker_id})")
+    journal_job(job, 'started')
+    started = False
+    finished = False
+    try:
+        while True:
+            await asyncio.sleep(BROKER_POLL_INTERVAL)
+            record = await broker.get(broker_id)
+            if record is None:
+                raise Exception("Задача пропала из брокера")
+            if record.status == 'queued':
+                job.remote_position = await broker.position(broker_id)
+            elif record.status == 'running':
+                job.remote_position = None
+                if not started:
+                    started = True
+                    metrics.observe('queue_wait', record.started_at - record.created_at)
+                if record.stage != job.stage:
+                    job.stage = record.stage
+                    job.stage_started = time.monotonic()
+                # Воркер сам соблюдает дедлайн; здесь — страховка от зависшего воркера
+                if time.time() - record.started_at > TIMEOUT_SECONDS + 2 * BROKER_LEASE_SECONDS:
+                    await broker.cancel(broker_id)
+                    raise JobTimeoutError(f"Превышено время ожидания ({TIMEOUT_SECONDS} сек)")
+            elif record.status == 'done':
+                finished = True
+                metrics.inc('jobs_total', outcome='success')
+                return GenerationResult(**record.result)
+            elif record.status == 'failed':
+                finished = True
+                metrics.inc('jobs_total', outcome='failure')
+                raise Exception(record.error or "Ошибка воркера")
+            elif record.status == 'cancelled':
+                finished = True
+                raise Exception("Задача отменена")
+    except asyncio.CancelledError:
+        await broker.cancel(broker_id)
+        metrics.inc('jobs_total', outcome='cancelled')
+        raise
+    finally:
+        if finished:
+            await broker.forget(broker_id)
+
+
+# Очередь задач генерации: ограничивает число одновременных вкладок в браузере.
+# Во фронтенде задачи только ждут воркеров, поэтому ждать могут все принятые сразу.
+if BOT_MODE == 'frontend':
+    job_queue = JobQueue(run_brokered_job, workers=QUEUE_MAX_SIZE, maxsize=QUEUE_MAX_SIZE)
+else:
+    job_queue = JobQueue(run_generation_job, workers=WORKERS_COUNT, maxsize=QUEUE_MAX_SIZE, job_timeout=TIMEOUT_SECONDS)
+
+metrics.gauge('queue_depth', lambda: job_queue.depth)
+metrics.gauge('busy_workers', lambda: job_queue.busy_workers)
+metrics.gauge('workers', lambda: job_queue.workers)
+metrics.gauge('outbound_queue', lambda: outbound.depth)
+
+# Этапы обработки задачи в порядке выполнения (для /stats)
+JOB_STAGES = [
+    'queue_wait', 'page_acquire', 'goto', 'prompt_input', 'v1_pick', 'generate_click',
+    'completion_wait', 'download', 'telegram_upload', 'history_cleanup', 'browser_startup', 'auth_probe',
+    'context_recycle', 'browser_restart', 'outbound_wait', 'postprocess', 'event_loop_lag',
+]
+
+# Выполняющиеся задачи по ключу промпта: одинаковые запросы ждут одну генерацию
+inflight_jobs: Dict[str, Job] = {}
+
+# Ожидающие ответа запросы пользователя: future завершается командой /cancel
+user_requests: Dict[int, Set[asyncio.Future]] = {}
+
+# Число выполняющихся пакетов (/batch) каждого пользователя
+user_batches: Dict[int, int] = {}
 
 
 @dp.message(Command("start"))
@@ -328,7 +1059,8 @@ async def cmd_start(message: Message):
     """
     Обработчик команды /start
     """
-    await message.answer(
+    await reply(
+        message,
         "🖼️ Добро пожаловать в MakeFilm AI Bot!\n\n"
         "Отправьте мне текстовый промпт, и я создам для вас изображение с помощью makefilm.ai\n\n"
         "Пример: 'Создай фото котика, играющего в саду'"
@@ -340,7 +1072,8 @@ async def cmd_help(message: Message):
     """
     Обработчик команды /help
     """
-    await message.answer(
+    await reply(
+        message,
         "📖 Помощь по использованию бота:\n\n"
         "• Отправьте любой текстовый промпт для создания изображения\n"
         "• Бот обработает ваш запрос и вернет ссылку на результат\n"
@@ -348,7 +1081,11 @@ async def cmd_help(message: Message):
         "Команды:\n"
         "/start - Начать работу с ботом\n"
         "/help - Показать эту справку\n"
-        "/status - Проверить статус бота"
+        "/status - Проверить статус бота\n"
+        "/stats - Статистика длительности этапов (для администраторов)\n"
+        "/fresh <промпт> - Сгенерировать заново, не используя сохраненный результат\n"
+        f"/batch - Несколько промптов разом, по одному в строке (до {BATCH_MAX_PROMPTS})\n"
+        "/cancel - Отменить ваши запросы в очереди и в работе"
     )
 
 
@@ -359,20 +1096,303 @@ async def cmd_status(message: Message):
     """
     status_text = "🟢 Бот работает нормально\n"
     
-    if browser and context:
+    if BOT_MODE == 'frontend':
+        status_text += f"🧩 Режим frontend: задач ждут воркеров в брокере: {await broker.depth()}\n"
+    elif browser_ready and not browser_ready.is_set():
+        status_text += "🟡 Браузер запускается, задачи ждут в очереди\n"
+    elif browser and any(account.ready for account in accounts):
         status_text += "🟢 Браузер инициализирован\n"
     else:
         status_text += "🔴 Браузер не инициализирован\n"
     
-    auth_state_exists = os.path.exists(AUTH_STATE_PATH)
-    if auth_state_exists:
-        status_text += f"🟢 Состояние авторизации найдено: {AUTH_STATE_PATH}\n"
-    else:
-        status_text += f"🔴 Состояние авторизации не найдено: {AUTH_STATE_PATH}\n"
+    for account in (accounts if BOT_MODE != 'frontend' else []):
+        if not os.path.exists(account.state_path):
+            status_text += f"🔴 Аккаунт {account.name}: состояние авторизации не найдено ({account.state_path})\n"
+        elif account.draining:
+            status_text += f"🔄 Аккаунт {account.name}: перезапуск контекста (задач {account.active_jobs})\n"
+        elif not account.ready:
+            status_text += f"🔴 Аккаунт {account.name}: не инициализирован\n"
+        elif not account.healthy:
+            status_text += f"🟡 Аккаунт {account.name}: временно выведен из ротации ({account.last_error})\n"
+        else:
+            status_text += (
+                f"🟢 Аккаунт {account.name}: задач {account.active_jobs}, "
+                f"страниц {account.pool.idle} свободно / {account.pool.busy} занято\n"
+            )
     
+    status_text += f"📥 Задач в очереди: {job_queue.depth}\n"
+    status_text += (
+        f"⚙️ Занято воркеров: {job_queue.busy_workers}/{job_queue.workers} "
+        f"({job_queue.busy_workers * 100 // job_queue.workers}%)\n"
+    )
+    status_text += f"📤 Сообщений в очереди отправки: {outbound.depth}\n"
+    status_text += f"📦 Кэш: {len(result_cache)} записей, попаданий {result_cache.hits}, промахов {result_cache.misses}\n"
+    if locator_engine.stats:
+        status_text += f"🎯 Селекторы:\n{locator_engine.summary()}\n"
+    if browser_supervisor and browser_supervisor.last_rss:
+        status_text += (
+            f"🧠 Память браузера: {browser_supervisor.last_rss / 1024 / 1024:.0f} МБ, "
+            f"задач с запуска: {browser_supervisor.browser_jobs}\n"
+        )
+    if network_profile:
+        status_text += f"🚫 Сеть: {network_profile.summary()}\n"
+    status_text += f"💾 Временные файлы: {media_store.usage() / 1024 / 1024:.1f} из {MEDIA_MAX_MB} МБ\n"
     status_text += f"⏱️ Таймаут ожидания: {TIMEOUT_SECONDS} сек"
     
-    await message.answer(status_text)
+    await reply(message, status_text)
+
+
+@dp.message(Command("stats"))
+async def cmd_stats(message: Message):
+    """
+    Обработчик команды /stats — перцентили длительности этапов (для администраторов)
+    """
+    if ADMIN_IDS and message.from_user.id not in ADMIN_IDS:
+        await reply(message, "⛔ Команда доступна только администраторам")
+        return
+    
+    lines = ["📊 Длительность этапов (p50 / p95, сек):"]
+    for stage in JOB_STAGES:
+        p50, p95 = metrics.percentiles(stage)
+        if p50 is None:
+            continue
+        lines.append(f"• {stage}: {p50:.1f} / {p95:.1f} (n={metrics.stages[stage].count})")
+    if len(lines) == 1:
+        lines.append("Пока нет данных")
+    
+    counters = [
+        f"• {name} {dict(labels)}: {value:g}"
+        for (name, labels), value in sorted(metrics.counters.items())
+    ]
+    if counters:
+        lines.append("\n🔢 Счетчики:")
+        lines.extend(counters)
+    
+    await reply(message, "\n".join(lines))
+
+
+async def reply(message: Message, text: str, priority: int = PRIORITY_REPLY) -> Message:
+    """
+    Отвечает в чат сообщения через планировщик отправки
+    """
+    return await outbound.send(message.chat.id, lambda: message.answer(text), priority)
+
+
+async def edit_message(message: Message, text: str, priority: int = PRIORITY_PROGRESS):
+    """
+    Редактирует сообщение через планировщик; еще не отправленная правка того же
+    сообщения заменяется новой
+    """
+    return await outbound.send(
+        message.chat.id,
+        lambda: message.edit_text(text),
+        priority,
+        key=f"edit:{message.chat.id}:{message.message_id}",
+    )
+
+
+async def send_result_photo(chat_id: int, photo, caption: str) -> Optional[str]:
+    """
+    Отправляет фото и возвращает его file_id для повторной отправки без загрузки
+    """
+    with metrics.span('telegram_upload'):
+        sent = await outbound.send(
+            chat_id, lambda: bot.send_photo(chat_id=chat_id, photo=photo, caption=caption), PRIORITY_RESULT
+        )
+    return sent.photo[-1].file_id if sent.photo else None
+
+
+async def send_result_document(chat_id: int, document, caption: str) -> Optional[str]:
+    """
+    Отправляет файл документом (без пережатия Telegram) и возвращает его file_id
+    """
+    with metrics.span('telegram_upload'):
+        sent = await outbound.send(
+            chat_id, lambda: bot.send_document(chat_id=chat_id, document=document, caption=caption), PRIORITY_RESULT
+        )
+    return sent.document.file_id if sent.document else None
+
+
+async def prepare_result(result: GenerationResult):
+    """
+    Готовит фото для Telegram из скачанного файла или перехваченных байтов (один раз на задачу)
+    """
+    if result.photo_path or not (result.file_path or result.image_bytes):
+        return
+    processed = await postprocessor.process(result.file_path or result.image_bytes)
+    if processed:
+        result.photo_path = processed.photo_path
+        result.document_path = processed.document_path
+
+
+async def send_cached_result(message: Message, user_prompt: str, entry: CacheEntry) -> bool:
+    """
+    Отвечает результатом из кэша: сначала по file_id, затем из сохраненного файла
+    """
+    caption = f"🖼️ Ваше изображение (из сохраненных результатов)\nПромпт: {user_prompt}"
+    if entry.file_id:
+        try:
+            await send_result_photo(message.chat.id, entry.file_id, caption)
+            return True
+        except Exception as e:
+            logger.warning(f"file_id из кэша не принят Telegram: {e}")
+            result_cache.forget_file_id(entry)
+    if entry.path and os.path.exists(entry.path):
+        try:
+            entry.file_id = await send_result_photo(message.chat.id, FSInputFile(entry.path), caption)
+            return True
+        except Exception as e:
+            logger.warning(f"Ошибка при отправке файла из кэша: {e}")
+    return False
+
+
+@dp.message(Command("fresh"))
+async def cmd_fresh(message: Message, command: CommandObject):
+    """
+    Обработчик команды /fresh — генерация без использования кэша
+    """
+    user_prompt = (command.args or '').strip()
+    if not user_prompt:
+        await reply(message, "❌ Укажите промпт после команды, например: /fresh котик в саду")
+        return
+    await generate_for_message(message, user_prompt, use_cache=False)
+
+
+@dp.message(Command("batch"))
+async def cmd_batch(message: Message, command: CommandObject):
+    """
+    Обработчик команды /batch — несколько промптов (по одному в строке) одной
+    задачей на одной странице генератора, результат приходит альбомом
+    """
+    prompts = [line.strip() for line in (command.args or '').splitlines() if line.strip()]
+    if not prompts:
+        await reply(message, "❌ Укажите промпты после команды, по одному в строке, например:\n/batch\nкотик в саду\nкотик на луне")
+        return
+    if BOT_MODE == 'frontend':
+        await reply(message, "❌ Пакетная генерация недоступна в этом режиме бота, отправьте промпты по одному")
+        return
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        await reply(message, f"❌ В пакете не больше {BATCH_MAX_PROMPTS} промптов, а у вас {len(prompts)}")
+        return
+    user_id = message.from_user.id
+    if user_batches.get(user_id, 0) >= BATCH_PER_USER:
+        await reply(message, "🚦 Дождитесь завершения предыдущего пакета (или отмените его командой /cancel)")
+        return
+
+    job = Job(
+        prompt=' | '.join(prompts), user_id=user_id, chat_id=message.chat.id,
+        batch=prompts, timeout=BATCH_TIMEOUT_SECONDS,
+    )
+    try:
+        position = job_queue.submit(job)
+    except QueueFullError:
+        await reply(message, "🚦 Сейчас слишком много запросов. Попробуйте еще раз через несколько минут.")
+        return
+    metrics.inc('batch_prompts_total', len(prompts))
+    user_batches[user_id] = user_batches.get(user_id, 0) + 1
+    processing_msg = None
+    progress = None
+    cancel = asyncio.get_running_loop().create_future()
+    user_requests.setdefault(user_id, set()).add(cancel)
+    try:
+        # Если ответ не отправился, finally снимет счетчик пакета и отменит задачу
+        processing_msg = await reply(message, f"⏳ Пакет из {len(prompts)} промптов в очереди, позиция: {position}")
+        progress = ProgressTracker(processing_msg, job, job_queue, edit_message, interval=PROGRESS_INTERVAL)
+        progress.start()
+        await asyncio.wait({job.future, cancel}, return_when=asyncio.FIRST_COMPLETED)
+        if cancel.done() or job.future.cancelled():
+            await progress.stop()
+            await edit_message(processing_msg, "🛑 Пакет отменен", PRIORITY_RESULT)
+            return
+        results = job.future.result()
+        progress.stage = 'telegram_upload'
+        await deliver_batch_result(message, processing_msg, prompts, results, progress)
+    except Exception as e:
+        logger.error(f"Ошибка при обработке пакета от пользователя {user_id}: {e}")
+        if processing_msg:
+            await progress.stop()
+            await edit_message(processing_msg, f"❌ Ошибка при обработке пакета:\n\n{str(e)}", PRIORITY_RESULT)
+    finally:
+        if progress:
+            await progress.stop()
+        requests = user_requests.get(user_id)
+        if requests is not None:
+            requests.discard(cancel)
+            if not requests:
+                user_requests.pop(user_id, None)
+        user_batches[user_id] -= 1
+        if user_batches[user_id] <= 0:
+            user_batches.pop(user_id, None)
+        if not job.future.done():
+            job_queue.cancel(job)
+        cleanup_job_files(job)
+
+
+async def deliver_batch_result(
+    message: Message,
+    processing_msg: Message,
+    prompts: List[str],
+    results: List[GenerationResult],
+    progress: ProgressTracker,
+):
+    """
+    Отправляет изображения пакета одним альбомом (подпись с промптами — у первого)
+    """
+    await asyncio.gather(*[prepare_result(result) for result in results])
+    media = []
+    for result in results:
+        if result.photo_path:
+            media.append(FSInputFile(result.photo_path))
+        elif result.file_path:
+            media.append(FSInputFile(result.file_path))
+        elif result.image_bytes:
+            media.append(BufferedInputFile(result.image_bytes, filename=result.image_name or 'image.jpg'))
+        elif result.img_src:
+            img_path = media_store.new_path(prefix='alt_')
+            try:
+                await download_to_file(urljoin(MAKEFILM_URL, result.img_src), img_path, MAX_IMAGE_MB * 1024 * 1024)
+            except Exception as e:
+                media_store.remove(img_path)
+                logger.warning(f"Не удалось скачать изображение пакета: {e}")
+                continue
+            result.fallback_path = img_path
+            media.append(FSInputFile(img_path))
+    if not media:
+        raise Exception("Не удалось получить изображения пакета")
+
+    # Порядок готовности на сайте может отличаться от порядка промптов — перечисляем все промпты
+    caption = "🖼️ Ваши изображения\n" + "\n".join(f"{i}. {prompt}" for i, prompt in enumerate(prompts, 1))
+    album = [
+        InputMediaPhoto(media=item, caption=caption[:1024] if index == 0 else None)
+        for index, item in enumerate(media)
+    ]
+    with metrics.span('telegram_upload'):
+        await outbound.send(
+            message.chat.id,
+            lambda: bot.send_media_group(chat_id=message.chat.id, media=album),
+            PRIORITY_RESULT,
+        )
+    metrics.inc('deliveries_total', path='batch')
+    await progress.stop()
+    await edit_message(
+        processing_msg, f"🖼️ Пакет готов: {len(media)} из {len(prompts)} изображений отправлено", PRIORITY_RESULT
+    )
+    logger.info(f"Пакет из {len(media)} изображений отправлен пользователю {message.from_user.id}")
+
+
+@dp.message(Command("cancel"))
+async def cmd_cancel(message: Message):
+    """
+    Обработчик команды /cancel — отменяет запросы пользователя
+    """
+    requests = user_requests.pop(message.from_user.id, set())
+    for cancel in requests:
+        if not cancel.done():
+            cancel.set_result(None)
+    if requests:
+        await reply(message, f"🛑 Отменено запросов: {len(requests)}")
+    else:
+        await reply(message, "Нет запросов для отмены")
 
 
 @dp.message()
@@ -383,100 +1403,476 @@ async def handle_text_message(message: Message):
     user_prompt = message.text.strip()
     
     if not user_prompt:
-        await message.answer("❌ Пожалуйста, отправьте текстовый промпт для генерации изображения.")
+        await reply(message, "❌ Пожалуйста, отправьте текстовый промпт для генерации изображения.")
         return
     
-    # Отправляем сообщение о начале обработки
-    processing_msg = await message.answer("⏳ Обрабатываю ваш запрос…")
+    await generate_for_message(message, user_prompt)
+
+
+async def generate_for_message(message: Message, user_prompt: str, use_cache: bool = True):
+    """
+    Отвечает на промпт пользователя: из кэша или через очередь генерации.
+    Принятый в очередь запрос записывается в журнал до получения результата.
+    """
+    if use_cache:
+        entry = result_cache.get(user_prompt)
+        if entry and await send_cached_result(message, user_prompt, entry):
+            metrics.inc('deliveries_total', path='cache')
+            logger.info(f"Результат из кэша отправлен пользователю {message.from_user.id}")
+            return
     
-    try:
-        logger.info(f"Обработка запроса от пользователя {message.from_user.id}: {user_prompt}")
-        
-        # Обрабатываем запрос через makefilm.ai
-        result_url, img_src, file_path = await process_makefilm_request(user_prompt)
+    key = result_cache.key(user_prompt)
+    job = inflight_jobs.get(key)
+    if job and not job.future.done():
+        # Такой же промпт уже генерируется — ждем его результат вместо новой генерации
+        job.waiters += 1
+        position = job_queue.position(job)
+        logger.info(f"Запрос пользователя {message.from_user.id} присоединен к задаче #{job.id}")
+        if position:
+            status_text = f"⏳ Такой же запрос уже в очереди (позиция {position}), пришлю результат"
+        else:
+            status_text = "⏳ Такой же запрос уже обрабатывается, пришлю результат"
+    else:
+        job = Job(prompt=user_prompt, user_id=message.from_user.id, chat_id=message.chat.id, key=key)
+        job.delivery_lock = asyncio.Lock()
+        try:
+            position = job_queue.submit(job)
+        except QueueFullError:
+            await reply(message, "🚦 Сейчас слишком много запросов. Попробуйте еще раз через несколько минут.")
+            return
+        inflight_jobs[key] = job
+        job.future.add_done_callback(lambda _: inflight_jobs.pop(key, None) if inflight_jobs.get(key) is job else None)
         
-        photo_sent = False
-        # Отправка уже готового файла из download
-        if file_path:
-            try:
-                with open(file_path, "rb") as photo_file:
-                    await bot.send_photo(
-                        chat_id=message.chat.id,
-                        photo=photo_file,
-                        caption=f"🖼️ Ваше изображение без watermark\nПромпт: {user_prompt}"
-                    )
-                    photo_sent = True
-            except Exception as e:
-                logger.warning(f"Ошибка при отправке файла: {e}")
-        # Пытаемся скачать по direct src
-        if not photo_sent and img_src:
-            try:
-                import aiohttp
-                logger.info('Скачиваю изображение по <img src> через aiohttp...')
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(img_src) as resp:
-                        if resp.status == 200:
-                            img_path = "/tmp/alt_img.jpg"
-                            with open(img_path, "wb") as f:
-                                f.write(await resp.read())
-                            # исправлено: теперь отправляем с помощью FSInputFile
-                            await bot.send_photo(
-                                chat_id=message.chat.id,
-                                photo=FSInputFile(img_path),
-                                caption=f"🖼️ Ваше изображение (резервно, через <img src>)\nПромпт: {user_prompt}"
-                            )
-                            photo_sent = True
-                            logger.info(f"Изображение отправлено по резервному пути (через img_src): {img_src}")
-            except Exception as e:
-                logger.warning(f"Reserve img download failed: {e}")
-        # Сразу после успешной отправки фото и photo_sent = True, удаляем картинку из истории
-            if photo_sent:
-                try:
-                    delete_btn_selector = '#radix-\\:ri\\:-content-history > div > div > div > div > div:nth-child(1) > div.p-3 > div.flex.justify-between.items-end > div.flex.items-center.gap-1 > button.inline-flex.items-center.justify-center.gap-2.whitespace-nowrap.rounded-md.text-sm.font-medium.ring-offset-background.transition-colors.focus-visible\\:outline-none.focus-visible\\:ring-2.focus-visible\\:ring-ring.focus-visible\\:ring-offset-2.disabled\\:pointer-events-none.disabled\\:opacity-50.\\[\\&_svg\\]:pointer-events-none.\\[\\&_svg\\]:size-4.\\[\\&_svg\\]:shrink-0.hover\\:bg-accent.h-6.w-6.text-gray-500.hover\\:text-red-500'
-                    await page.wait_for_selector(delete_btn_selector, timeout=8000)
-                    await page.click(delete_btn_selector)
-                    logger.info('Удалено изображение из истории (клик по delete-btn)')
-                except Exception as e:
-                    logger.warning(f'Ошибка при удалении из истории: {e}')
-        # Фолбек — только ссылка если всё не удалось
-        if not photo_sent:
-            await processing_msg.edit_text(
-                f"🖼️ Ваше изображение готово!\n\n"
-                f"📝 Промпт: {user_prompt}\n"
-                f"🔗 Ссылка: {result_url}\n\n"
-                f"⏰ Время обработки: {datetime.now().strftime('%H:%M:%S')}"
-            )
+        # Сообщаем пользователю его позицию в очереди
+        if BOT_MODE == 'frontend':
+            # Позиция в брокере станет известна после передачи задачи воркерам — её покажет прогресс
+            status_text = "⏳ Ваш запрос в очереди, ожидаю свободный воркер…"
+        elif not job_queue.accepting:
+            status_text = f"⏳ Бот запускается, ваш запрос в очереди, позиция: {position}"
+        elif position <= job_queue.workers - job_queue.busy_workers:
+            status_text = "⏳ Обрабатываю ваш запрос…"
         else:
-            await processing_msg.edit_text("🖼️ Файл сгенерирован и отправлен!\nПроверьте последний медиа-файл в чате.")
+            status_text = f"⏳ Ваш запрос в очереди, позиция: {position}"
+    
+    # Запрос можно отменить командой /cancel, не затрагивая других ожидающих ту же задачу
+    cancel = asyncio.get_running_loop().create_future()
+    user_requests.setdefault(message.from_user.id, set()).add(cancel)
+    processing_msg = None
+    progress = None
+    journal_id = None
+    try:
+        # Если ответ не отправился (например, бот заблокирован), finally снимет
+        # ожидающего и отменит задачу, когда она больше никому не нужна
+        processing_msg = await reply(message, status_text)
+        if journal:
+            journal_id = journal.accepted(
+                user_prompt, message.from_user.id, message.chat.id, message.message_id,
+                progress_message_id=processing_msg.message_id,
+            )
+            job.journal_ids.append(journal_id)
+            if job.started_at is not None:
+                journal.record(journal_id, 'started')
+        progress = ProgressTracker(processing_msg, job, job_queue, edit_message, interval=PROGRESS_INTERVAL)
+        progress.start()
         
-        logger.info(f"Результат отправлен пользователю {message.from_user.id}")
+        # Ждем, пока воркер обработает запрос через makefilm.ai или пользователь его отменит
+        await asyncio.wait({job.future, cancel}, return_when=asyncio.FIRST_COMPLETED)
+        if cancel.done() or job.future.cancelled():
+            journal_request(journal_id, 'cancelled')
+            await progress.stop()
+            await edit_message(processing_msg, "🛑 Запрос отменен", PRIORITY_RESULT)
+            return
+        result = job.future.result()
         
+        # Ожидающие одну задачу отправляют результат по очереди: первый загружает файл,
+        # остальные переиспользуют полученный file_id
+        async with job.delivery_lock:
+            await deliver_job_result(message, processing_msg, job, user_prompt, result, progress)
+        journal_request(journal_id, 'completed', file_id=job.file_id)
+        
+    except QueueStoppedError:
+        # Запрос остается незавершенным в журнале и будет выполнен после запуска
+        if progress:
+            await progress.stop()
+            await edit_message(processing_msg, "🔄 Бот перезапускается, запрос будет выполнен после запуска", PRIORITY_RESULT)
     except Exception as e:
         error_msg = f"❌ Произошла ошибка при обработке запроса:\n\n{str(e)}\n\nПопробуйте еще раз или обратитесь к администратору."
         
-        await processing_msg.edit_text(error_msg)
+        journal_request(journal_id, 'failed', error=str(e))
         logger.error(f"Ошибка при обработке запроса от пользователя {message.from_user.id}: {e}")
+        if processing_msg:
+            if progress:
+                await progress.stop()
+            await edit_message(processing_msg, error_msg, PRIORITY_RESULT)
+    finally:
+        if progress:
+            await progress.stop()
+        requests = user_requests.get(message.from_user.id)
+        if requests is not None:
+            requests.discard(cancel)
+            if not requests:
+                user_requests.pop(message.from_user.id, None)
+        # Последний ожидающий удаляет временные файлы задачи, а если результат
+        # больше никому не нужен — отменяет её и освобождает воркер
+        job.waiters -= 1
+        if job.waiters <= 0:
+            if not job.future.done():
+                job_queue.cancel(job)
+            cleanup_job_files(job)
+
+
+def journal_request(journal_id: Optional[str], event: str, **fields):
+    if journal and journal_id:
+        journal.record(journal_id, event, **fields)
+
+
+async def recover_journal(pending: list):
+    """
+    Продолжает (или сообщает о них пользователям) запросы, не завершенные
+    до перезапуска. Уже выполненные запросы в журнале завершены и не повторяются;
+    результат, отправленный перед самой остановкой, придет из кэша без генерации.
+    """
+    if not pending:
+        return
+    logger.info(f"♻️ Незавершенных запросов в журнале: {len(pending)} (режим {JOURNAL_RECOVERY})")
+    metrics.inc('journal_recovered_total', len(pending), mode=JOURNAL_RECOVERY)
+    resumed = []
+    for entry in pending:
+        journal.record(entry['id'], 'resumed')
+        chat = Chat(id=entry['chat_id'], type='private' if entry['chat_id'] > 0 else 'group')
+        user = User(id=entry['user_id'], is_bot=False, first_name=str(entry['user_id']))
+        if entry.get('progress_message_id'):
+            text = (
+                "🔄 Бот перезапускался, продолжаю обработку запроса"
+                if JOURNAL_RECOVERY == 'resume' else
+                "⚠️ Бот перезапускался, и запрос не был выполнен. Отправьте промпт еще раз."
+            )
+            progress_msg = Message(
+                message_id=entry['progress_message_id'], date=datetime.now(), chat=chat, text=text,
+            ).as_(bot)
+            try:
+                await edit_message(progress_msg, text, PRIORITY_RESULT)
+            except Exception as e:
+                logger.debug(f"Не удалось обновить сообщение о запросе {entry['id']}: {e}")
+        if JOURNAL_RECOVERY != 'resume':
+            continue
+        message = Message(
+            message_id=entry.get('message_id') or 0,
+            date=datetime.now(),
+            chat=chat,
+            from_user=user,
+            text=entry['prompt'],
+        ).as_(bot)
+        resumed.append(generate_for_message(message, entry['prompt']))
+    # При остановке бота незаконченные запросы отменяются и останутся в журнале
+    await asyncio.gather(*resumed, return_exceptions=True)
+
+
+def cleanup_job_files(job: Job):
+    """
+    Удаляет временные файлы результата задачи (в кэше хранятся свои копии)
+    """
+    if job.future is None or not job.future.done() or job.future.cancelled() or job.future.exception():
+        return
+    result = job.future.result()
+    for item in result if isinstance(result, list) else [result]:
+        for path in (item.file_path, item.fallback_path, item.photo_path, item.document_path):
+            media_store.remove(path)
+
+
+async def deliver_job_result(
+    message: Message,
+    processing_msg: Message,
+    job: Job,
+    user_prompt: str,
+    result: GenerationResult,
+    progress: ProgressTracker,
+):
+    """
+    Отправляет пользователю результат задачи генерации
+    """
+    progress.stage = 'telegram_upload'
+    photo_sent = False
+    uploaded = False
+    sent_path = None
+    file_id = None
+    # Результат уже загружен в Telegram для другого ожидающего — отправляем по file_id
+    if job.file_id:
+        try:
+            await send_result_photo(
+                message.chat.id,
+                job.file_id,
+                f"🖼️ Ваше изображение без watermark\nПромпт: {user_prompt}"
+            )
+            photo_sent = True
+            metrics.inc('deliveries_total', path='file_id')
+        except Exception as e:
+            logger.warning(f"Ошибка при отправке по file_id: {e}")
+    # Фото, подготовленное под лимиты Telegram (обработка в пуле процессов)
+    if not photo_sent:
+        await prepare_result(result)
+    if not photo_sent and result.photo_path:
+        try:
+            file_id = await send_result_photo(
+                message.chat.id,
+                FSInputFile(result.photo_path),
+                f"🖼️ Ваше изображение без watermark\nПромпт: {user_prompt}"
+                if result.file_path else f"🖼️ Ваше изображение\nПромпт: {user_prompt}"
+            )
+            photo_sent = True
+            uploaded = True
+            sent_path = result.photo_path
+            metrics.inc('deliveries_total', path='postprocessed')
+        except Exception as e:
+            logger.warning(f"Ошибка при отправке подготовленного фото: {e}")
+    # Отправка уже готового файла из download
+    if not photo_sent and result.file_path:
+        try:
+            file_id = await send_result_photo(
+                message.chat.id,
+                FSInputFile(result.file_path),
+                f"🖼️ Ваше изображение без watermark\nПромпт: {user_prompt}"
+            )
+            photo_sent = True
+            uploaded = True
+            sent_path = result.file_path
+            metrics.inc('deliveries_total', path='download')
+        except Exception as e:
+            logger.warning(f"Ошибка при отправке файла: {e}")
+    # Байты изображения, перехваченные со страницы, — без повторного скачивания
+    if not photo_sent and result.image_bytes:
+        try:
+            file_id = await send_result_photo(
+                message.chat.id,
+                BufferedInputFile(result.image_bytes, filename=result.image_name or 'image.jpg'),
+                f"🖼️ Ваше изображение\nПромпт: {user_prompt}"
+            )
+            photo_sent = True
+            uploaded = True
+            metrics.inc('deliveries_total', path='network')
+        except Exception as e:
+            logger.warning(f"Ошибка при отправке перехваченного изображения: {e}")
+    # Пытаемся скачать по direct src
+    if not photo_sent and result.img_src:
+        try:
+            if not result.fallback_path:
+                logger.info('Скачиваю изображение по <img src>...')
+                img_path = media_store.new_path(prefix='alt_')
+                try:
+                    await download_to_file(urljoin(MAKEFILM_URL, result.img_src), img_path, MAX_IMAGE_MB * 1024 * 1024)
+                except Exception:
+                    media_store.remove(img_path)
+                    raise
+                result.fallback_path = img_path
+            file_id = await send_result_photo(
+                message.chat.id,
+                FSInputFile(result.fallback_path),
+                f"🖼️ Ваше изображение (резервно, через <img src>)\nПромпт: {user_prompt}"
+            )
+            photo_sent = True
+            uploaded = True
+            sent_path = result.fallback_path
+            metrics.inc('deliveries_total', path='img_src')
+            logger.info(f"Изображение отправлено по резервному пути (через img_src): {result.img_src}")
+        except Exception as e:
+            logger.warning(f"Reserve img download failed: {e}")
+    # Оригинал в полном разрешении — файлом, если включено
+    if photo_sent and (result.document_file_id or result.document_path):
+        try:
+            result.document_file_id = await send_result_document(
+                message.chat.id,
+                result.document_file_id or FSInputFile(result.document_path),
+                "📎 Оригинал в полном разрешении",
+            ) or result.document_file_id
+        except Exception as e:
+            logger.warning(f"Ошибка при отправке оригинала: {e}")
+    await progress.stop()
+    # Фолбек — только ссылка если всё не удалось
+    if not photo_sent:
+        metrics.inc('deliveries_total', path='link')
+        await edit_message(
+            processing_msg,
+            f"🖼️ Ваше изображение готово!\n\n"
+            f"📝 Промпт: {user_prompt}\n"
+            f"🔗 Ссылка: {result.result_url or urljoin(MAKEFILM_URL, result.img_src or '')}\n\n"
+            f"⏰ Время обработки: {datetime.now().strftime('%H:%M:%S')}",
+            PRIORITY_RESULT,
+        )
+    else:
+        if uploaded:
+            job.file_id = file_id
+            # Запоминаем результат, чтобы повторный такой же промпт получил ответ мгновенно
+            result_cache.put(user_prompt, sent_path, file_id, data=None if sent_path else result.image_bytes)
+        await edit_message(
+            processing_msg, "🖼️ Файл сгенерирован и отправлен!\nПроверьте последний медиа-файл в чате.", PRIORITY_RESULT
+        )
+    
+    logger.info(f"Результат отправлен пользователю {message.from_user.id}")
+
+
+# Задачи, сообщающие брокеру итог задач воркера (main дожидается их перед закрытием брокера)
+broker_reporters: Set[asyncio.Task] = set()
+
+
+async def report_broker_job(broker_id: int, job: Job):
+    """
+    Продлевает аренду задачи брокера, пока она выполняется, и сообщает итог.
+    Если фронтенд отменил задачу (или её забрал другой воркер), прерывает её.
+    """
+    while not job.future.done():
+        await asyncio.wait({job.future}, timeout=BROKER_LEASE_SECONDS / 3)
+        if job.future.done():
+            break
+        if not await broker.heartbeat(broker_id, WORKER_ID, BROKER_LEASE_SECONDS, job.stage):
+            logger.info(f"Задача брокера #{broker_id} отменена или передана другому воркеру")
+            job_queue.cancel(job)
+            return
+    if job.future.cancelled():
+        return
+    if isinstance(job.future.exception(), QueueStoppedError):
+        # Воркер останавливается — задачу выполнит другой воркер
+        if await broker.release(broker_id, WORKER_ID):
+            logger.info(f"Задача брокера #{broker_id} возвращена в очередь")
+        return
+    if job.future.exception():
+        await broker.fail(broker_id, WORKER_ID, str(job.future.exception()))
+        return
+    result = job.future.result()
+    if result.image_bytes and not result.file_path:
+        # Фронтенд получает результат через общий каталог файлов
+        result.file_path = media_store.new_path(suffix=os.path.splitext(result.image_name or '')[1] or '.jpg')
+        with open(result.file_path, 'wb') as f:
+            f.write(result.image_bytes)
+    result.image_bytes = None
+    await broker.complete(broker_id, WORKER_ID, asdict(result))
+
+
+async def run_broker_worker():
+    """
+    Режим worker: забирает задачи из брокера, пока есть свободные воркеры
+    """
+    logger.info(f"Воркер {WORKER_ID} берет задачи из {BROKER_PATH}")
+    while True:
+        await browser_ready.wait()
+        if job_queue.depth + job_queue.busy_workers >= job_queue.workers:
+            await asyncio.sleep(BROKER_POLL_INTERVAL)
+            continue
+        record = await broker.claim(WORKER_ID, BROKER_LEASE_SECONDS)
+        if record is None:
+            await asyncio.sleep(BROKER_POLL_INTERVAL)
+            continue
+        job = Job(prompt=record.prompt, user_id=record.user_id, chat_id=record.chat_id)
+        job_queue.submit(job)
+        logger.info(f"Задача брокера #{record.id} принята как #{job.id} (попытка {record.attempts})")
+        task = asyncio.create_task(report_broker_job(record.id, job))
+        broker_reporters.add(task)
+        task.add_done_callback(broker_reporters.discard)
 
 
 async def main():
     """
     Основная функция запуска бота
     """
+    global browser_ready, browser_supervisor, history_cleaner
+    
+    metrics_runner = None
+    webhook_runner = None
+    warmup_task = None
+    recovery_task = None
+    lag_task = None
     try:
         logger.info("Запуск Telegram бота с сохраненным состоянием авторизации...")
         
-        # Инициализируем браузер
-        await init_browser()
+        # Пул обработки изображений запускаем до браузера: его процессы не должны
+        # попасть в playwright_pids, по которым считается память браузера
+        await postprocessor.start()
+        
+        # Запускаем воркеры очереди генерации: задачи принимаются сразу,
+        # а обрабатываются после прогрева браузера
+        if BOT_MODE == 'frontend':
+            # Браузер работает в процессах-воркерах
+            await job_queue.start()
+        else:
+            browser_ready = asyncio.Event()
+            await job_queue.start(ready=browser_ready)
+            browser_supervisor = BrowserSupervisor(
+                accounts,
+                account_scheduler,
+                job_queue,
+                browser_ready,
+                open_account=reopen_account,
+                restart_browser=restart_browser,
+                is_connected=lambda: browser is not None and browser.is_connected(),
+                memory_usage=lambda: subtree_rss(playwright_pids),
+                context_max_jobs=CONTEXT_MAX_JOBS,
+                browser_max_jobs=BROWSER_MAX_JOBS,
+                max_rss_bytes=BROWSER_MAX_RSS_MB * 1024 * 1024,
+                interval=SUPERVISOR_INTERVAL,
+            )
+            history_cleaner = HistoryCleaner(
+                accounts,
+                MAKEFILM_URL,
+                browser_ready,
+                interval=HISTORY_CLEANUP_INTERVAL,
+                keep=HISTORY_KEEP,
+                batch_size=HISTORY_CLEANUP_BATCH,
+            )
+            
+            # Браузер прогревается в фоне, не задерживая начало приема сообщений
+            warmup_task = asyncio.create_task(warm_up_browser(), name="browser-warmup")
+        
+        if METRICS_PORT:
+            metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        lag_task = asyncio.create_task(watch_loop_lag(), name="loop-lag")
+        
+        if journal:
+            pending = journal.load()
+            journal.start()
+            recovery_task = asyncio.create_task(recover_journal(pending), name="journal-recovery")
         
         # Запускаем бота
-        logger.info("Бот запущен и готов к работе!")
-        await dp.start_polling(bot)
+        if BOT_MODE == 'worker':
+            await run_broker_worker()
+        elif UPDATES_MODE == 'webhook':
+            webhook_runner = await start_webhook_server(
+                dp, bot, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL or None
+            )
+            logger.info("Бот запущен в режиме webhook и готов к работе!")
+            await asyncio.Event().wait()
+        else:
+            # Оставшийся после режима webhook адрес не дает получать обновления через polling
+            await bot.delete_webhook()
+            logger.info("Бот запущен и готов к работе!")
+            await dp.start_polling(bot)
         
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
     finally:
-        # Закрываем браузер при завершении
+        # Останавливаем воркеры и закрываем браузер при завершении
+        for task in (warmup_task, recovery_task, lag_task):
+            if task and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if browser_supervisor:
+            await browser_supervisor.stop()
+        if history_cleaner:
+            await history_cleaner.stop()
+        if webhook_runner:
+            await webhook_runner.cleanup()
+            await bot.session.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await job_queue.stop()
+        # Итоги и возврат задач в брокер должны записаться до его закрытия
+        await asyncio.gather(*broker_reporters, return_exceptions=True)
+        await outbound.stop()
+        if journal:
+            await journal.stop()
         await close_browser()
+        await postprocessor.stop()
+        await close_http_session()
+        if broker:
+            await broker.close()
 
 
 if __name__ == '__main__':
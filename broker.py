@@ -0,0 +1,281 @@
+"""
+Брокер задач между фронтендом бота и процессами-воркерами с браузером
+"""
+
+import abc
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BrokerRecord:
+    """
+    Задача в брокере
+    """
+    id: int
+    prompt: str
+    user_id: int
+    chat_id: int
+    status: str
+    stage: Optional[str] = None
+    attempts: int = 0
+    worker_id: Optional[str] = None
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class JobBroker(abc.ABC):
+    """
+    Интерфейс брокера. Фронтенд ставит задачи (submit), следит за ними (get)
+    и отменяет (cancel); воркер забирает задачу с арендой (claim), продлевает
+    аренду (heartbeat) и сообщает итог (complete/fail) или возвращает задачу
+    в очередь при остановке (release). Задача, аренда которой истекла (воркер
+    упал), снова выдается другому воркеру.
+    """
+
+    @abc.abstractmethod
+    async def submit(self, prompt: str, user_id: int, chat_id: int) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def get(self, job_id: int) -> Optional[BrokerRecord]:
+        ...
+
+    @abc.abstractmethod
+    async def position(self, job_id: int) -> Optional[int]:
+        ...
+
+    @abc.abstractmethod
+    async def cancel(self, job_id: int) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def forget(self, job_id: int):
+        ...
+
+    @abc.abstractmethod
+    async def claim(self, worker_id: str, lease: float) -> Optional[BrokerRecord]:
+        ...
+
+    @abc.abstractmethod
+    async def heartbeat(self, job_id: int, worker_id: str, lease: float, stage: Optional[str] = None) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def complete(self, job_id: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def release(self, job_id: int, worker_id: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def depth(self) -> int:
+        ...
+
+    async def close(self):
+        pass
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class SQLiteJobBroker(JobBroker):
+    """
+    Брокер в файле SQLite только для фронтенда и воркеров на одной машине:
+    режим WAL использует разделяемую память и не работает через сетевые
+    файловые системы (NFS, SMB), поэтому общий диск между машинами не подходит.
+    Запросы выполняются в пуле потоков, выдача задач атомарна между
+    процессами за счет BEGIN IMMEDIATE.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3, retention: float = 86400.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    async def _run(self, fn, *args):
+        def call():
+            with self._lock:
+                return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> BrokerRecord:
+        return BrokerRecord(
+            id=row['id'],
+            prompt=row['prompt'],
+            user_id=row['user_id'],
+            chat_id=row['chat_id'],
+            status=row['status'],
+            stage=row['stage'],
+            attempts=row['attempts'],
+            worker_id=row['worker_id'],
+            created_at=row['created_at'],
+            started_at=row['started_at'],
+            result=json.loads(row['result']) if row['result'] else None,
+            error=row['error'],
+        )
+
+    async def submit(self, prompt: str, user_id: int, chat_id: int) -> int:
+        def do():
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (prompt, user_id, chat_id, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (prompt, user_id, chat_id, time.time()),
+            )
+            return cursor.lastrowid
+        return await self._run(do)
+
+    async def get(self, job_id: int) -> Optional[BrokerRecord]:
+        def do():
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._record(row) if row else None
+        return await self._run(do)
+
+    async def position(self, job_id: int) -> Optional[int]:
+        def do():
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND id <= ? "
+                "AND EXISTS (SELECT 1 FROM jobs WHERE id = ? AND status = 'queued')",
+                (job_id, job_id),
+            ).fetchone()
+            return row[0] or None
+        return await self._run(do)
+
+    async def cancel(self, job_id: int) -> bool:
+        # Воркер узнает об отмене по неудачному heartbeat
+        def do():
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id),
+            )
+            return cursor.rowcount > 0
+        return await self._run(do)
+
+    async def forget(self, job_id: int):
+        await self._run(lambda: self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,)))
+
+    async def claim(self, worker_id: str, lease: float) -> Optional[BrokerRecord]:
+        def do():
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Завершенные задачи, которые фронтенд не забрал (например, отмененные в очереди)
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+                    (now - self.retention,),
+                )
+                # Задачи упавших воркеров: исчерпавшие попытки завершаем ошибкой, остальные выдаем снова
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, error = 'воркер не отвечает' "
+                    "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if not row:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?, started_at = ?, "
+                    "stage = NULL, attempts = attempts + 1 WHERE id = ?",
+                    (worker_id, now + lease, now, row['id']),
+                )
+                record = self._record(self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone())
+                self._conn.execute("COMMIT")
+                return record
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return await self._run(do)
+
+    async def heartbeat(self, job_id: int, worker_id: str, lease: float, stage: Optional[str] = None) -> bool:
+        def do():
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, stage = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time() + lease, stage, job_id, worker_id),
+            )
+            return cursor.rowcount > 0
+        return await self._run(do)
+
+    async def complete(self, job_id: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        def do():
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ?, result = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time(), json.dumps(result), job_id, worker_id),
+            )
+            return cursor.rowcount > 0
+        return await self._run(do)
+
+    async def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        def do():
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time(), error, job_id, worker_id),
+            )
+            return cursor.rowcount > 0
+        return await self._run(do)
+
+    async def release(self, job_id: int, worker_id: str) -> bool:
+        # Остановка воркера — не неудачная попытка: задача сразу достается другому воркеру
+        def do():
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, lease_until = NULL, stage = NULL, "
+                "started_at = NULL, attempts = MAX(attempts - 1, 0) "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (job_id, worker_id),
+            )
+            return cursor.rowcount > 0
+        return await self._run(do)
+
+    async def depth(self) -> int:
+        return await self._run(
+            lambda: self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        )
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,187 @@
+"""
+Надзор за браузером: плановый перезапуск контекстов и браузера по числу задач
+и памяти, автоматический перезапуск после падения браузера
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from accounts import Account, AccountScheduler
+from job_queue import JobQueue
+from metrics import metrics
+from procinfo import descendants_rss
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserSupervisor:
+    """
+    Периодически проверяет аккаунты и процесс браузера.
+
+    Контекст аккаунта, выполнивший context_max_jobs задач, выводится из ротации,
+    дожидается завершения своих задач и пересоздается через open_account.
+    Браузер перезапускается через restart_browser, если выполнено browser_max_jobs
+    задач, память браузера превысила max_rss_bytes или он отключился: воркеры
+    перестают брать задачи (ready сбрасывается), текущие задачи завершаются,
+    а очередь сохраняется и продолжает обрабатываться после перезапуска.
+    """
+
+    def __init__(
+        self,
+        accounts: List[Account],
+        scheduler: AccountScheduler,
+        job_queue: JobQueue,
+        ready: asyncio.Event,
+        open_account: Callable[[Account], Awaitable[None]],
+        restart_browser: Callable[[], Awaitable[None]],
+        is_connected: Callable[[], bool],
+        memory_usage: Callable[[], int] = descendants_rss,
+        context_max_jobs: int = 0,
+        browser_max_jobs: int = 0,
+        max_rss_bytes: int = 0,
+        interval: float = 15.0,
+    ):
+        self.accounts = accounts
+        self.scheduler = scheduler
+        self.job_queue = job_queue
+        self.ready = ready
+        self._open_account = open_account
+        self._restart_browser = restart_browser
+        self._is_connected = is_connected
+        self._memory_usage = memory_usage
+        self.context_max_jobs = context_max_jobs
+        self.browser_max_jobs = browser_max_jobs
+        self.max_rss_bytes = max_rss_bytes
+        self.interval = interval
+        self.restarting = False
+        self.last_rss = 0
+        self._launched = False
+        self._browser_jobs_base = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._recycling: List[asyncio.Task] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def browser_jobs(self) -> int:
+        """Задач с последнего запуска браузера"""
+        return sum(account.total_jobs for account in self.accounts) - self._browser_jobs_base
+
+    def start(self):
+        if self._task:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="browser-supervisor")
+
+    async def stop(self):
+        tasks = [task for task in [self._task, *self._recycling] if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._recycling.clear()
+
+    def notify_disconnected(self):
+        """
+        Вызывается из события disconnected браузера
+        """
+        if self._wake and not self.restarting:
+            logger.warning("⚠️ Браузер отключился")
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.ready.wait()
+            try:
+                await self._check()
+            except Exception as e:
+                logger.error(f"Ошибка надзора за браузером: {e}")
+
+    async def _check(self):
+        if self._is_connected():
+            self._launched = True
+        elif self._launched:
+            await self.restart('disconnected')
+            return
+
+        self.last_rss = self._memory_usage()
+        if self.max_rss_bytes and self.last_rss > self.max_rss_bytes:
+            logger.warning(
+                f"⚠️ Память браузера {self.last_rss / 1024 / 1024:.0f} МБ превысила "
+                f"{self.max_rss_bytes / 1024 / 1024:.0f} МБ"
+            )
+            await self.restart('memory')
+            return
+        if self.browser_max_jobs and self.browser_jobs >= self.browser_max_jobs:
+            await self.restart('jobs')
+            return
+
+        if self.context_max_jobs:
+            for account in self.accounts:
+                if account.ready and not account.draining and account.context_jobs >= self.context_max_jobs:
+                    self._recycling.append(asyncio.create_task(self.recycle_account(account)))
+        self._recycling = [task for task in self._recycling if not task.done()]
+
+    async def recycle_account(self, account: Account):
+        """
+        Дожидается завершения задач аккаунта и пересоздает его контекст
+        """
+        account.draining = True
+        logger.info(f"🔄 Перезапуск контекста аккаунта {account.name} после {account.context_jobs} задач")
+        try:
+            while account.active_jobs:
+                await asyncio.sleep(0.5)
+            with metrics.span('context_recycle'):
+                if account.pool:
+                    await account.pool.stop()
+                    account.pool = None
+                if account.context:
+                    try:
+                        await account.context.close()
+                    except Exception as e:
+                        logger.warning(f"Ошибка при закрытии контекста {account.name}: {e}")
+                    account.context = None
+                account.context_jobs = 0
+                await self._open_account(account)
+            metrics.inc('recycles_total', scope='context', reason='jobs')
+        except Exception as e:
+            logger.error(f"Не удалось перезапустить контекст аккаунта {account.name}: {e}")
+        finally:
+            account.draining = False
+            self.scheduler.wake()
+
+    async def restart(self, reason: str):
+        """
+        Останавливает выдачу задач, дожидается текущих и перезапускает браузер
+        """
+        if self.restarting:
+            return
+        self.restarting = True
+        self.ready.clear()
+        logger.warning(f"🔄 Перезапуск браузера ({reason}), задачи в очереди ждут: {self.job_queue.depth}")
+        try:
+            for task in self._recycling:
+                task.cancel()
+            await asyncio.gather(*self._recycling, return_exceptions=True)
+            self._recycling.clear()
+            while self.job_queue.busy_workers:
+                await asyncio.sleep(0.5)
+            with metrics.span('browser_restart'):
+                await self._restart_browser()
+            metrics.inc('recycles_total', scope='browser', reason=reason)
+        except Exception as e:
+            logger.error(f"Ошибка при перезапуске браузера: {e}")
+        finally:
+            for account in self.accounts:
+                account.draining = False
+                account.context_jobs = 0
+            self._browser_jobs_base = sum(account.total_jobs for account in self.accounts)
+            self.restarting = False
+            self.ready.set()
+            self.scheduler.wake()
+            logger.info("✅ Браузер перезапущен, обработка очереди продолжается")
@@ -0,0 +1,138 @@
+"""
+Фоновая очистка истории генераций makefilm.ai, вне пути ответа пользователю
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from playwright.async_api import Page
+
+from accounts import Account
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Вкладка истории в панели генератора (id вида radix-:ri:-trigger-history меняется между сборками сайта)
+HISTORY_TAB_SELECTOR = '[id$="-trigger-history"]'
+# Карточки генераций в истории, новые сверху
+HISTORY_ITEM_SELECTOR = '[id$="-content-history"] > div > div > div > div > div'
+# Кнопка удаления внутри карточки
+HISTORY_DELETE_SELECTOR = 'div.p-3 button.hover\\:text-red-500'
+
+
+class HistoryCleaner:
+    """
+    Раз в interval секунд удаляет из истории каждого аккаунта старые генерации,
+    оставляя keep последних, не больше batch_size за проход.
+
+    Работает на своей странице генератора в контексте аккаунта, а не на
+    страницах пула, поэтому не задерживает задачи. Удаляются только самые
+    старые карточки: новые сверху могут принадлежать еще выполняющимся задачам.
+    """
+
+    def __init__(
+        self,
+        accounts: List[Account],
+        url: str,
+        ready: asyncio.Event,
+        interval: float = 300.0,
+        keep: int = 10,
+        batch_size: int = 20,
+        load_timeout: float = 60.0,
+    ):
+        self.accounts = accounts
+        self.url = url
+        self.ready = ready
+        self.interval = interval
+        self.keep = keep
+        self.batch_size = batch_size
+        self.load_timeout = load_timeout
+        self._pages: Dict[str, Page] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run(), name="history-cleanup")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for page in self._pages.values():
+            if not page.is_closed():
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+        self._pages.clear()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.ready.wait()
+            for account in self.accounts:
+                # Контекст, выводимый из ротации, скоро будет закрыт супервизором
+                if not account.ready or account.draining:
+                    continue
+                try:
+                    with metrics.span('history_cleanup'):
+                        deleted = await self.clean(account)
+                    if deleted:
+                        metrics.inc('history_deleted_total', deleted, account=account.name)
+                        logger.info(f"🧹 [{account.name}] Удалено из истории генераций: {deleted}")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"[{account.name}] Ошибка при очистке истории: {e}")
+                    await self._drop_page(account)
+
+    async def _page(self, account: Account) -> Page:
+        """
+        Своя страница генератора в текущем контексте аккаунта (после перезапуска
+        контекста или браузера открывается заново)
+        """
+        page = self._pages.get(account.name)
+        if page and not page.is_closed() and page.context is account.context:
+            await page.reload(timeout=self.load_timeout * 1000)
+            return page
+        page = await account.context.new_page()
+        self._pages[account.name] = page
+        await page.goto(self.url, timeout=self.load_timeout * 1000)
+        return page
+
+    async def _drop_page(self, account: Account):
+        page = self._pages.pop(account.name, None)
+        if page and not page.is_closed():
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+    async def clean(self, account: Account) -> int:
+        """
+        Удаляет самые старые генерации сверх keep, возвращает число удаленных
+        """
+        page = await self._page(account)
+        await page.click(HISTORY_TAB_SELECTOR, timeout=15000)
+        items = page.locator(HISTORY_ITEM_SELECTOR)
+        try:
+            await items.first.wait_for(timeout=10000)
+        except Exception:
+            # История пуста
+            return 0
+        deleted = 0
+        count = await items.count()
+        while count > self.keep and deleted < self.batch_size:
+            await items.nth(count - 1).locator(HISTORY_DELETE_SELECTOR).click(timeout=5000)
+            # Ждем, пока карточка исчезнет, прежде чем удалять следующую
+            await page.wait_for_function(
+                "([selector, count]) => document.querySelectorAll(selector).length < count",
+                arg=[HISTORY_ITEM_SELECTOR, count],
+                timeout=5000,
+            )
+            deleted += 1
+            count = await items.count()
+        return deleted
@@ -0,0 +1,273 @@
+"""
+Очередь задач генерации с ограниченным размером и пулом воркеров
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_job_ids = itertools.count(1)
+
+
+class QueueFullError(Exception):
+    """
+    Очередь заполнена — новая задача не принята
+    """
+
+
+class JobTimeoutError(Exception):
+    """
+    Задача не уложилась в дедлайн и была прервана
+    """
+
+
+class QueueStoppedError(Exception):
+    """
+    Очередь остановлена (бот перезапускается) до выполнения задачи
+    """
+
+
+@dataclass
+class GenerationResult:
+    """
+    Результат генерации: ссылка, src итогового <img>, путь к скачанному файлу
+    и байты изображения, перехваченные из сетевого ответа страницы
+    """
+    result_url: Optional[str] = None
+    img_src: Optional[str] = None
+    file_path: Optional[str] = None
+    # Файл, скачанный по img_src при отправке (если не удалось отправить другие варианты)
+    fallback_path: Optional[str] = None
+    image_bytes: Optional[bytes] = None
+    image_name: Optional[str] = None
+    # Подготовленное для Telegram фото, оригинал-документ без метаданных и его file_id
+    photo_path: Optional[str] = None
+    document_path: Optional[str] = None
+    document_file_id: Optional[str] = None
+
+
+@dataclass
+class Job:
+    """
+    Задача генерации изображения по промпту
+    """
+    prompt: str
+    user_id: int
+    chat_id: int
+    id: int = field(default_factory=lambda: next(_job_ids))
+    created_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    future: Optional[asyncio.Future] = None
+    # Ключ нормализованного промпта и число чатов, ожидающих результат задачи
+    key: Optional[str] = None
+    waiters: int = 1
+    # file_id результата после первой отправки и блокировка, чтобы ожидающие отправляли по очереди
+    file_id: Optional[str] = None
+    delivery_lock: Optional[asyncio.Lock] = None
+    # Дедлайн выполнения (время event loop) и задача обработчика, пока задача выполняется
+    deadline: Optional[float] = None
+    task: Optional[asyncio.Task] = None
+    # Текущий этап выполнения (для сообщений о прогрессе) и время его начала
+    stage: Optional[str] = None
+    stage_started: Optional[float] = None
+    # Позиция в очереди брокера, пока задачу не взял воркер (режим frontend)
+    remote_position: Optional[int] = None
+    # Записи журнала запросов, ожидающих эту задачу
+    journal_ids: List[str] = field(default_factory=list)
+    # Промпты пакетной задачи (/batch) и её собственный лимит времени вместо общего
+    batch: Optional[List[str]] = None
+    timeout: Optional[float] = None
+
+    def remaining(self, cap: Optional[float] = None) -> float:
+        """
+        Секунд до дедлайна (не больше cap), 0 — дедлайн прошел
+        """
+        if self.deadline is None:
+            return cap if cap is not None else float('inf')
+        remaining = max(0.0, self.deadline - asyncio.get_running_loop().time())
+        return min(remaining, cap) if cap is not None else remaining
+
+    def remaining_ms(self, cap: Optional[float] = None) -> float:
+        """
+        То же в миллисекундах для таймаутов Playwright: не меньше 100,
+        потому что 0 там означает ожидание без ограничения
+        """
+        return max(100.0, self.remaining(cap) * 1000)
+
+
+class JobQueue:
+    """
+    Ограниченная очередь задач и N воркеров, обрабатывающих её параллельно.
+
+    Если очередь заполнена, submit() поднимает QueueFullError (backpressure),
+    а результат каждой задачи доступен через job.future.
+
+    Задаче при старте назначается дедлайн job_timeout секунд: обработчик
+    должен укладываться в него сам (job.remaining()), а через grace секунд
+    после дедлайна воркер прерывает его принудительно. Отмененная задача
+    (cancel()) завершает job.future отменой и освобождает воркер.
+    """
+
+    def __init__(self, handler: Callable[[Job], Awaitable[Any]], workers: int = 2, maxsize: int = 50,
+                 job_timeout: float = 0, grace: float = 5.0):
+        self._handler = handler
+        self._workers_count = max(1, workers)
+        self._maxsize = maxsize
+        self._job_timeout = job_timeout
+        self._grace = grace
+        # Создаётся в start(), чтобы очередь была привязана к работающему event loop
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Deque[Job] = deque()
+        self._workers: List[asyncio.Task] = []
+        self._busy = 0
+        self._ready: Optional[asyncio.Event] = None
+
+    @property
+    def depth(self) -> int:
+        """Количество задач, ожидающих воркера"""
+        return len(self._pending)
+
+    @property
+    def workers(self) -> int:
+        return self._workers_count
+
+    @property
+    def busy_workers(self) -> int:
+        return self._busy
+
+    @property
+    def accepting(self) -> bool:
+        """Воркеры уже берут задачи (а не ждут готовности браузера)"""
+        return self._ready is None or self._ready.is_set()
+
+    def position(self, job: Job) -> Optional[int]:
+        """
+        Позиция задачи в очереди (1 — следующая), None если задача уже выполняется
+        """
+        try:
+            return self._pending.index(job) + 1
+        except ValueError:
+            return None
+
+    def submit(self, job: Job) -> int:
+        """
+        Ставит задачу в очередь и возвращает её позицию
+        """
+        if self._queue is None:
+            raise RuntimeError("Очередь задач не запущена")
+        # Емкость считаем по ожидающим задачам: отмененные в очереди ее сразу освобождают,
+        # хотя еще лежат в asyncio.Queue до того, как воркер их пропустит
+        if len(self._pending) >= self._maxsize:
+            raise QueueFullError(f"Очередь заполнена ({self._maxsize} задач)")
+        if job.future is None:
+            job.future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(job)
+        self._pending.append(job)
+        logger.info(f"📥 Задача #{job.id} поставлена в очередь, позиция {len(self._pending)}")
+        return len(self._pending)
+
+    def cancel(self, job: Job) -> bool:
+        """
+        Отменяет задачу в очереди или прерывает выполняющуюся
+        """
+        if job.future is None or job.future.done():
+            return False
+        if job in self._pending:
+            self._pending.remove(job)
+            job.future.cancel()
+            logger.info(f"🛑 Задача #{job.id} отменена в очереди")
+            return True
+        if job.task and not job.task.done():
+            job.task.cancel()
+            return True
+        return False
+
+    async def start(self, ready: Optional[asyncio.Event] = None):
+        """
+        Запускает воркеры. Если передан ready, задачи принимаются в очередь
+        всегда, а воркеры берут их, только пока ready установлен
+        """
+        if self._workers:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._ready = ready
+        for idx in range(self._workers_count):
+            self._workers.append(asyncio.create_task(self._worker(idx), name=f"job-worker-{idx}"))
+        logger.info(f"✅ Запущено воркеров генерации: {self._workers_count}")
+
+    async def stop(self):
+        """
+        Останавливает воркеры, задачи в очереди завершаются QueueStoppedError
+        """
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        while self._pending:
+            job = self._pending.popleft()
+            if job.future and not job.future.done():
+                job.future.set_exception(QueueStoppedError("Бот остановлен"))
+
+    async def _worker(self, idx: int):
+        while True:
+            job: Job = await self._queue.get()
+            # Пока браузер запускается или перезапускается, задача остается в очереди
+            if self._ready:
+                await self._ready.wait()
+            if job.future.done():
+                # Задачу отменили, пока она ждала в очереди
+                self._queue.task_done()
+                continue
+            try:
+                self._pending.remove(job)
+            except ValueError:
+                pass
+            self._busy += 1
+            job.started_at = time.monotonic()
+            loop = asyncio.get_running_loop()
+            job_timeout = job.timeout or self._job_timeout
+            if job_timeout:
+                job.deadline = loop.time() + job_timeout
+            logger.info(
+                f"⚙️ Воркер {idx} взял задачу #{job.id} "
+                f"(ожидание в очереди {job.started_at - job.created_at:.1f} сек)"
+            )
+            job.task = asyncio.create_task(self._handler(job), name=f"job-{job.id}")
+            try:
+                timeout = job.remaining() + self._grace if job.deadline is not None else None
+                done, _ = await asyncio.wait({job.task}, timeout=timeout)
+                if not done:
+                    job.task.cancel()
+                    await asyncio.gather(job.task, return_exceptions=True)
+                    logger.warning(f"⏱️ Задача #{job.id} прервана по дедлайну ({job_timeout:.0f} сек)")
+                    if not job.future.done():
+                        job.future.set_exception(
+                            JobTimeoutError(f"Превышено время ожидания ({job_timeout:.0f} сек)")
+                        )
+                elif job.task.cancelled():
+                    logger.info(f"🛑 Задача #{job.id} отменена во время выполнения")
+                    if not job.future.done():
+                        job.future.cancel()
+                elif job.task.exception():
+                    logger.error(f"Ошибка в воркере {idx} при обработке задачи #{job.id}: {job.task.exception()}")
+                    if not job.future.done():
+                        job.future.set_exception(job.task.exception())
+                elif not job.future.done():
+                    job.future.set_result(job.task.result())
+            except asyncio.CancelledError:
+                job.task.cancel()
+                await asyncio.gather(job.task, return_exceptions=True)
+                if not job.future.done():
+                    job.future.set_exception(QueueStoppedError("Бот остановлен"))
+                raise
+            finally:
+                job.task = None
+                self._busy -= 1
+                self._queue.task_done()
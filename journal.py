@@ -0,0 +1,163 @@
+"""
+Журнал запросов на генерацию: переживает перезапуск бота, чтобы незавершенные
+запросы можно было продолжить, а завершенные не выполнять повторно
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# События, после которых запрос считается завершенным
+FINISHED_EVENTS = ('completed', 'failed', 'cancelled', 'resumed')
+
+
+class JobJournal:
+    """
+    Журнал событий запросов в формате JSON Lines, только дозапись.
+
+    События копятся в памяти и сбрасываются на диск пачкой (с fsync) раз
+    в flush_interval секунд. Когда в файле больше compact_lines строк, он
+    переписывается: остаются только незавершенные запросы. При запуске load()
+    возвращает запросы, начатые, но не завершенные до остановки процесса.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, compact_lines: int = 1000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_lines = compact_lines
+        self._open: Dict[str, dict] = {}
+        self._buffer: List[str] = []
+        self._lines = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._writing: Optional[asyncio.Future] = None
+
+    def load(self) -> List[dict]:
+        """
+        Читает журнал и возвращает незавершенные запросы (в порядке поступления)
+        """
+        self._open.clear()
+        self._lines = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Недописанная строка при аварийной остановке
+                        logger.warning(f"Пропущена поврежденная строка журнала {self.path}")
+                        continue
+                    self._apply(event)
+        pending = list(self._open.values())
+        self._compact()
+        return pending
+
+    def _apply(self, event: dict):
+        request_id = event.get('id')
+        if event.get('event') == 'accepted':
+            self._open[request_id] = dict(event)
+        elif request_id in self._open:
+            if event.get('event') in FINISHED_EVENTS:
+                del self._open[request_id]
+            else:
+                self._open[request_id]['state'] = event.get('event')
+
+    def accepted(self, prompt: str, user_id: int, chat_id: int, message_id: Optional[int] = None, **fields) -> str:
+        """
+        Записывает принятый запрос и возвращает его id в журнале (fields —
+        дополнительные поля, например id сообщения о прогрессе)
+        """
+        request_id = uuid.uuid4().hex
+        self.record(
+            request_id, 'accepted', prompt=prompt, user_id=user_id, chat_id=chat_id, message_id=message_id, **fields
+        )
+        return request_id
+
+    def record(self, request_id: str, event: str, **fields):
+        """
+        Добавляет событие запроса (started, completed, failed, cancelled, resumed)
+        """
+        entry = {'id': request_id, 'event': event, 'ts': round(time.time(), 3), **fields}
+        self._apply(entry)
+        self._buffer.append(json.dumps(entry, ensure_ascii=False))
+        if self._wakeup and len(self._buffer) >= 100:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="job-journal")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Отмена задачи не останавливает запись в потоке: дожидаемся её, иначе сжатие
+        # старым снимком может затереть строки, которые сейчас допишет _flush()
+        if self._writing:
+            await asyncio.gather(self._writing, return_exceptions=True)
+            self._writing = None
+        self._flush()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._buffer:
+                continue
+            # Буфер и снимок состояния берем в потоке event loop, пишем в пуле потоков
+            lines, self._buffer = self._buffer, []
+            compact = self._compact_needed(len(lines))
+            entries = list(self._open.values()) if compact else None
+            self._writing = loop.run_in_executor(None, self._write, lines, entries)
+            try:
+                await asyncio.shield(self._writing)
+            except Exception as e:
+                logger.error(f"Не удалось записать журнал {self.path}: {e}")
+
+    def _compact_needed(self, new_lines: int) -> bool:
+        return self._lines + new_lines > self.compact_lines and self._lines + new_lines > 2 * len(self._open)
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        self._write(lines, list(self._open.values()) if self._compact_needed(len(lines)) else None)
+
+    def _write(self, lines: List[str], compact_entries: Optional[List[dict]] = None):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._lines += len(lines)
+        if compact_entries is not None:
+            self._compact(compact_entries)
+
+    def _compact(self, entries: Optional[List[dict]] = None):
+        """
+        Переписывает журнал, оставляя только незавершенные запросы
+        """
+        if entries is None:
+            entries = list(self._open.values())
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._lines = len(entries)
+        logger.info(f"Журнал {self.path} сжат: незавершенных запросов {len(entries)}")
@@ -0,0 +1,133 @@
+"""
+Поиск элементов страницы несколькими стратегиями одновременно
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from playwright.async_api import Locator, Page
+
+logger = logging.getLogger(__name__)
+
+Root = Union[Page, Locator]
+
+
+class LocatorNotFoundError(Exception):
+    """
+    Ни одна стратегия не нашла элемент
+    """
+
+
+@dataclass
+class Strategy:
+    """
+    Способ найти элемент: фабрика локатора от корня (страницы или контейнера).
+    delay — задержка старта в гонке, чтобы более точные стратегии имели фору.
+    """
+    name: str
+    build: Callable[[Root], Locator]
+    delay: float = 0.0
+
+
+class LocatorEngine:
+    """
+    Находит элемент, запуская все стратегии параллельно и беря первую сработавшую.
+
+    Для каждого элемента запоминается стратегия-победитель: в следующий раз
+    она проверяется первой с коротким таймаутом, и только при промахе
+    запускается общая гонка. Ведется статистика попаданий и промахов.
+    """
+
+    def __init__(self, preferred_timeout: float = 2.0):
+        self.preferred_timeout = preferred_timeout
+        self._winners: Dict[str, str] = {}
+        # element -> strategy -> [попадания, промахи]
+        self.stats: Dict[str, Dict[str, List[int]]] = {}
+
+    def winner(self, element: str) -> Optional[str]:
+        return self._winners.get(element)
+
+    def _record(self, element: str, strategy: str, hit: bool):
+        counters = self.stats.setdefault(element, {}).setdefault(strategy, [0, 0])
+        counters[0 if hit else 1] += 1
+
+    async def _try(self, root: Root, strategy: Strategy, state: str, timeout: float) -> Locator:
+        if strategy.delay:
+            await asyncio.sleep(strategy.delay)
+        locator = strategy.build(root).first
+        await locator.wait_for(state=state, timeout=max(timeout - strategy.delay, 0.1) * 1000)
+        return locator
+
+    async def resolve(
+        self,
+        element: str,
+        root: Root,
+        strategies: List[Strategy],
+        timeout: float = 10.0,
+        state: str = 'visible',
+    ) -> Locator:
+        """
+        Возвращает локатор элемента или поднимает LocatorNotFoundError.
+        timeout — общий бюджет: гонка получает то, что осталось после
+        проверки запомненной стратегии.
+        """
+        deadline = time.monotonic() + timeout
+        remaining = list(strategies)
+        preferred = next((s for s in strategies if s.name == self._winners.get(element)), None)
+        if preferred:
+            try:
+                locator = await self._try(root, Strategy(preferred.name, preferred.build), state,
+                                          min(timeout, self.preferred_timeout))
+                self._record(element, preferred.name, True)
+                return locator
+            except Exception:
+                self._record(element, preferred.name, False)
+                remaining = [s for s in strategies if s is not preferred]
+                # Запомненная стратегия может сработать позже — оставляем её в гонке без форы
+                remaining.append(Strategy(preferred.name, preferred.build))
+
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise LocatorNotFoundError(f"Элемент {element} не найден за {timeout:.1f} сек")
+        name, locator = await self._race(element, root, remaining, state, left)
+        if self._winners.get(element) != name:
+            logger.info(f"🎯 {element}: сработала стратегия {name}")
+        self._winners[element] = name
+        return locator
+
+    async def _race(
+        self, element: str, root: Root, strategies: List[Strategy], state: str, timeout: float
+    ) -> Tuple[str, Locator]:
+        tasks = {
+            asyncio.ensure_future(self._try(root, strategy, state, timeout)): strategy.name
+            for strategy in strategies
+        }
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = tasks[task]
+                    if task.exception() is None:
+                        self._record(element, name, True)
+                        return name, task.result()
+                    self._record(element, name, False)
+            raise LocatorNotFoundError(f"Элемент {element} не найден ни одной из {len(strategies)} стратегий")
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def summary(self) -> str:
+        """
+        Краткая сводка: победившая стратегия и доля попаданий по каждому элементу
+        """
+        lines = []
+        for element, by_strategy in self.stats.items():
+            hits = sum(c[0] for c in by_strategy.values())
+            total = hits + sum(c[1] for c in by_strategy.values())
+            lines.append(f"{element}: {self._winners.get(element, '—')} ({hits}/{total})")
+        return "\n".join(lines)
@@ -0,0 +1,149 @@
+"""
+Временные медиафайлы задач и общий пул HTTP-соединений
+"""
+
+import logging
+import os
+import tempfile
+import time
+from typing import Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Возвращает общую для процесса HTTP-сессию (создается при первом обращении)
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=120, sock_read=30),
+        )
+    return _http_session
+
+
+async def close_http_session():
+    """
+    Закрывает общую HTTP-сессию
+    """
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+class MediaTooLargeError(Exception):
+    """
+    Файл превышает допустимый размер
+    """
+
+
+class MediaStore:
+    """
+    Каталог временных файлов задач: уникальные имена, удаление после отправки
+    и ограничение суммарного размера на диске (старые файлы удаляются первыми).
+
+    Файлы моложе min_age по лимиту размера не удаляются: это скачанные, но еще
+    не отправленные результаты, в том числе файлы, которые воркер передал
+    фронтенду через брокер. Каталог может временно превысить лимит.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 500 * 1024 * 1024, max_age: float = 3600.0,
+                 min_age: float = 600.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max(max_age, min_age)
+        self.min_age = min_age
+
+    def new_path(self, suffix: str = '.jpg', prefix: str = 'img_') -> str:
+        """
+        Создает пустой файл с уникальным именем и возвращает его путь
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.enforce_limit()
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=self.directory)
+        os.close(fd)
+        return path
+
+    def remove(self, path: Optional[str]):
+        """
+        Удаляет файл задачи, если он лежит в каталоге хранилища
+        """
+        if not path or os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.directory):
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Не удалось удалить временный файл {path}: {e}")
+
+    def usage(self) -> int:
+        """
+        Суммарный размер файлов в каталоге, байт
+        """
+        return sum(size for _, _, size in self._files())
+
+    def enforce_limit(self):
+        """
+        Удаляет просроченные файлы и самые старые (но не моложе min_age),
+        пока каталог не уложится в лимит
+        """
+        files = sorted(self._files())
+        total = sum(size for _, _, size in files)
+        now = time.time()
+        for mtime, path, size in files:
+            age = now - mtime
+            if age <= self.max_age and (total <= self.max_bytes or age < self.min_age):
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        if total > self.max_bytes:
+            logger.warning(
+                f"Временные файлы занимают {total / 1024 / 1024:.1f} МБ при лимите "
+                f"{self.max_bytes / 1024 / 1024:.0f} МБ: остальные файлы еще используются"
+            )
+
+    def _files(self):
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+        result = []
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    result.append((stat.st_mtime, entry.path, stat.st_size))
+            except OSError:
+                continue
+        return result
+
+
+async def download_to_file(url: str, path: str, max_bytes: int, chunk_size: int = 64 * 1024) -> int:
+    """
+    Скачивает url потоково по частям в файл, не держа тело ответа в памяти.
+    Возвращает число записанных байт.
+    """
+    session = get_http_session()
+    written = 0
+    async with session.get(url) as resp:
+        resp.raise_for_status()
+        if resp.content_length and resp.content_length > max_bytes:
+            raise MediaTooLargeError(f"Размер файла {resp.content_length} байт превышает лимит {max_bytes}")
+        with open(path, 'wb') as f:
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise MediaTooLargeError(f"Файл превышает лимит {max_bytes} байт")
+                f.write(chunk)
+    return written
@@ -0,0 +1,159 @@
+"""
+Метрики бота: длительность этапов, счетчики исходов и HTTP-эндпоинт в формате Prometheus
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180, 300, 600)
+
+
+class Histogram:
+    """
+    Гистограмма длительностей с корзинами Prometheus и окном последних
+    значений для расчета перцентилей
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 500):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Перцентиль q (0..1) по последним значениям
+        """
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+        return values[index]
+
+
+class Metrics:
+    """
+    Реестр метрик процесса
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    def observe(self, stage: str, seconds: float):
+        """
+        Записывает длительность этапа
+        """
+        self.stages.setdefault(stage, Histogram()).observe(seconds)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """
+        Замеряет длительность блока как этап stage (в том числе при исключении)
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - started)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        """
+        Увеличивает счетчик name с метками labels
+        """
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, getter: Callable[[], float]):
+        """
+        Регистрирует показатель, значение которого читается при экспорте
+        """
+        self.gauges[name] = getter
+
+    def percentiles(self, stage: str) -> Tuple[Optional[float], Optional[float]]:
+        """
+        p50 и p95 этапа
+        """
+        histogram = self.stages.get(stage)
+        if not histogram:
+            return None, None
+        return histogram.percentile(0.5), histogram.percentile(0.95)
+
+    def render_prometheus(self) -> str:
+        """
+        Текстовый формат экспорта Prometheus
+        """
+        lines: List[str] = [
+            "# HELP makefilm_stage_seconds Длительность этапов обработки задачи",
+            "# TYPE makefilm_stage_seconds histogram",
+        ]
+        for stage, histogram in sorted(self.stages.items()):
+            for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                lines.append(f'makefilm_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'makefilm_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'makefilm_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'makefilm_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE makefilm_{name} counter")
+                typed.add(name)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"makefilm_{name}{{{label_text}}} {value:g}")
+        for name, getter in sorted(self.gauges.items()):
+            try:
+                value = float(getter())
+            except Exception:
+                continue
+            lines.append(f"# TYPE makefilm_{name} gauge")
+            lines.append(f"makefilm_{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+async def watch_loop_lag(interval: float = 1.0):
+    """
+    Замеряет задержку event loop: насколько позже запланированного
+    просыпается sleep (этап event_loop_lag)
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe('event_loop_lag', max(0.0, loop.time() - started - interval))
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """
+    Запускает HTTP-сервер с эндпоинтом /metrics
+    """
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return runner
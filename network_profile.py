@@ -0,0 +1,198 @@
+"""
+Профиль сетевых запросов страниц автоматизации: отсекает шрифты, видео,
+аналитику и трекеры, которые боту не нужны для генерации.
+
+Шрифты, видео и маяки отключаются настройками Firefox (без перехвата);
+через Python перехватываются только запросы к доменам трекеров. Любой
+перехват в Playwright отключает HTTP-кэш контекста, поэтому с routes=False
+остаются только настройки браузера, а кэш работает.
+"""
+
+import logging
+import re
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+from playwright.async_api import BrowserContext, Request, Route
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Типы ресурсов, которые не нужны ни для поиска элементов, ни для результата
+DEFAULT_BLOCKED_TYPES = ('font', 'media', 'beacon', 'csp_report', 'ping')
+
+# Аналитика, трекеры и виджеты поддержки
+DEFAULT_BLOCKED_DOMAINS = (
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googleadservices.com',
+    'facebook.net', 'facebook.com', 'connect.facebook.net', 'hotjar.com', 'clarity.ms',
+    'mixpanel.com', 'segment.io', 'segment.com', 'amplitude.com', 'intercom.io', 'intercomcdn.com',
+    'crisp.chat', 'tiktok.com', 'analytics.tiktok.com', 'posthog.com', 'yandex.ru/metrika',
+    'mc.yandex.ru', 'sentry.io', 'fullstory.com', 'twitter.com', 'ads-twitter.com', 'linkedin.com',
+)
+
+# Типы ресурсов, которые отключаются настройками Firefox без перехвата запросов
+_TYPE_PREFS: Dict[str, Dict[str, Any]] = {
+    # Системные шрифты вместо загружаемых страницей
+    'font': {'browser.display.use_document_fonts': 0},
+    # Видео и аудио не загружаются заранее и не запускаются сами
+    'media': {'media.autoplay.default': 5, 'media.preload.default': 0, 'media.preload.auto': 0},
+    'beacon': {'beacon.enabled': False},
+    'ping': {'browser.send_pings': False},
+    'csp_report': {'security.csp.reporting.enabled': False},
+}
+
+# Заглушки вместо прерывания: скрипт трекера «загружается» пустым, и код страницы не падает
+_STUBS = {
+    'script': ('application/javascript', ''),
+    'stylesheet': ('text/css', ''),
+}
+
+# Типичный размер отсеченного ресурса для оценки сэкономленного трафика
+# (точный размер неизвестен — запрос не выполнялся)
+TYPICAL_SIZES = {
+    'font': 40 * 1024,
+    'media': 500 * 1024,
+    'image': 60 * 1024,
+    'script': 30 * 1024,
+    'stylesheet': 15 * 1024,
+}
+
+
+def _parse_list(value: str) -> tuple:
+    return tuple(item.strip().lower() for item in value.split(',') if item.strip())
+
+
+class NetworkProfile:
+    """
+    Правила отсечения запросов браузера.
+
+    Типы из blocked_types, для которых есть настройка Firefox, отключаются
+    через firefox_prefs() при запуске браузера. Перехватываются только запросы
+    к blocked_domains (и все запросы, если в blocked_types есть тип без такой
+    настройки, например image). Запрос пропускается, если его хост есть в
+    allow_domains или url подходит под allow_url_pattern (например,
+    RESULT_IMAGE_URL_PATTERN — итоговое изображение не должно отсекаться
+    никогда). Скрипты и стили трекеров заменяются пустой заглушкой.
+    """
+
+    def __init__(
+        self,
+        blocked_types: Iterable[str] = DEFAULT_BLOCKED_TYPES,
+        blocked_domains: Iterable[str] = DEFAULT_BLOCKED_DOMAINS,
+        allow_domains: Iterable[str] = (),
+        allow_url_pattern: Optional[str] = None,
+        routes: bool = True,
+    ):
+        self.routes = routes
+        self.blocked_types = frozenset(blocked_types)
+        self.blocked_domains = tuple(blocked_domains)
+        self.allow_domains = tuple(allow_domains)
+        self.allow_url_re = re.compile(allow_url_pattern) if allow_url_pattern else None
+        self.blocked_requests: Dict[str, int] = {}
+        self.saved_bytes = 0
+
+    @classmethod
+    def from_env(cls, blocked_types: str, blocked_domains: str, allow_domains: str,
+                 allow_url_pattern: Optional[str] = None, routes: bool = True) -> 'NetworkProfile':
+        """
+        Профиль из переменных окружения: списки через запятую добавляются
+        к значениям по умолчанию, '-' в начале списка типов или доменов
+        отменяет значения по умолчанию
+        """
+        types = DEFAULT_BLOCKED_TYPES
+        if blocked_types.startswith('-'):
+            types, blocked_types = (), blocked_types[1:]
+        domains = DEFAULT_BLOCKED_DOMAINS
+        if blocked_domains.startswith('-'):
+            domains, blocked_domains = (), blocked_domains[1:]
+        return cls(
+            blocked_types=types + _parse_list(blocked_types),
+            blocked_domains=domains + _parse_list(blocked_domains),
+            allow_domains=_parse_list(allow_domains),
+            allow_url_pattern=allow_url_pattern,
+            routes=routes,
+        )
+
+    @staticmethod
+    def _matches(host: str, domains: tuple, path: str = '') -> bool:
+        for domain in domains:
+            domain_host, _, domain_path = domain.partition('/')
+            if host == domain_host or host.endswith('.' + domain_host):
+                if not domain_path or path.lstrip('/').startswith(domain_path):
+                    return True
+        return False
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        """
+        Нужно ли отсечь запрос
+        """
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https'):
+            return False
+        host = (parsed.hostname or '').lower()
+        if self._matches(host, self.allow_domains) or (self.allow_url_re and self.allow_url_re.search(url)):
+            return False
+        if resource_type in self.blocked_types:
+            return True
+        return self._matches(host, self.blocked_domains, parsed.path)
+
+    async def _handle(self, route: Route, request: Request):
+        resource_type = request.resource_type
+        if not self.should_block(request.url, resource_type):
+            await route.fallback()
+            return
+
+        self.blocked_requests[resource_type] = self.blocked_requests.get(resource_type, 0) + 1
+        saved = TYPICAL_SIZES.get(resource_type, 0)
+        self.saved_bytes += saved
+        metrics.inc('blocked_requests_total', type=resource_type)
+        metrics.inc('blocked_bytes_estimate_total', saved)
+        try:
+            stub = _STUBS.get(resource_type)
+            if stub:
+                content_type, body = stub
+                await route.fulfill(status=200, content_type=content_type, body=body)
+            else:
+                await route.abort('blockedbyclient')
+        except Exception as e:
+            # Страница могла закрыться, пока запрос был в обработке
+            logger.debug(f"Не удалось отсечь запрос {request.url}: {e}")
+
+    def firefox_prefs(self) -> Dict[str, Any]:
+        """
+        Настройки Firefox для типов ресурсов, отключаемых без перехвата
+        """
+        prefs: Dict[str, Any] = {}
+        for resource_type in self.blocked_types:
+            prefs.update(_TYPE_PREFS.get(resource_type, {}))
+        return prefs
+
+    def _domains_pattern(self) -> Optional[re.Pattern]:
+        alternatives = []
+        for domain in self.blocked_domains:
+            domain_host, _, domain_path = domain.partition('/')
+            host = re.escape(domain_host) + r'(?::\d+)?'
+            alternatives.append(host + ('/' + re.escape(domain_path) if domain_path else r'(?:[/?#]|$)'))
+        if not alternatives:
+            return None
+        return re.compile(r'^https?://(?:[^/?#]*\.)?(?:' + '|'.join(alternatives) + ')', re.IGNORECASE)
+
+    async def apply(self, context: BrowserContext):
+        """
+        Включает перехват для всех страниц контекста: только домены трекеров,
+        а если заданы типы без настройки Firefox — все запросы
+        """
+        if not self.routes:
+            return
+        if self.blocked_types - set(_TYPE_PREFS):
+            await context.route('**/*', self._handle)
+            return
+        pattern = self._domains_pattern()
+        if pattern:
+            await context.route(pattern, self._handle)
+
+    def summary(self) -> str:
+        total = sum(self.blocked_requests.values())
+        by_type = ", ".join(f"{kind} {count}" for kind, count in sorted(self.blocked_requests.items()))
+        return f"отсечено {total} запросов (~{self.saved_bytes / 1024 / 1024:.1f} МБ){': ' + by_type if by_type else ''}"
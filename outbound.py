@@ -0,0 +1,233 @@
+"""
+Планировщик исходящих запросов к Telegram: общие и по-чатовые лимиты,
+приоритет результатов над сообщениями о прогрессе, повтор после RetryAfter
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки: меньше — раньше
+PRIORITY_RESULT = 0
+PRIORITY_REPLY = 1
+PRIORITY_PROGRESS = 2
+
+_PRIORITY_NAMES = {PRIORITY_RESULT: 'result', PRIORITY_REPLY: 'reply', PRIORITY_PROGRESS: 'progress'}
+
+_seq = itertools.count()
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше capacity подряд
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """
+        Сколько секунд ждать до появления токена
+        """
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """
+        Блокирует отправку на seconds секунд (ответ RetryAfter от Telegram)
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    @property
+    def idle(self) -> bool:
+        return self.tokens >= self.capacity and self.blocked_until <= time.monotonic()
+
+
+@dataclass
+class OutboundItem:
+    priority: int
+    chat_id: int
+    call: Callable[[], Awaitable[Any]]
+    future: asyncio.Future
+    key: Optional[str] = None
+    seq: int = field(default_factory=lambda: next(_seq))
+    submitted_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+class OutboundScheduler:
+    """
+    Единая очередь исходящих запросов бота.
+
+    Запрос уходит, когда есть токены в общем ведре (global_rate в секунду)
+    и в ведре его чата (chat_rate для личных чатов, group_rate для групп).
+    Из готовых к отправке первым уходит запрос с меньшим приоритетом, так что
+    результаты не ждут за обновлениями прогресса. Запрос с тем же key, что и еще
+    не отправленный, заменяет его (например, несколько правок одного сообщения) —
+    оба вызывающих получают результат последнего. После RetryAfter чат
+    ставится на паузу, а запрос повторяется.
+    """
+
+    def __init__(self, global_rate: float = 25.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 group_rate: float = 20 / 60, max_attempts: int = 5):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_attempts = max_attempts
+        self._chats: Dict[int, TokenBucket] = {}
+        self._pending: List[OutboundItem] = []
+        self._by_key: Dict[str, OutboundItem] = {}
+        self._inflight = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def _chat(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 1000:
+                # Забываем чаты, которые давно ничего не отправляли
+                for idle_id in [cid for cid, b in self._chats.items() if b.idle]:
+                    del self._chats[idle_id]
+            # Отрицательные id — группы и каналы, у них лимит строже
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    def _ensure_started(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="outbound-scheduler")
+
+    async def send(self, chat_id: int, call: Callable[[], Awaitable[Any]],
+                   priority: int = PRIORITY_REPLY, key: Optional[str] = None) -> Any:
+        """
+        Ставит запрос в очередь и возвращает его результат
+        """
+        self._ensure_started()
+        existing = self._by_key.get(key) if key else None
+        if existing:
+            existing.call = call
+            if priority < existing.priority:
+                existing.priority = priority
+            metrics.inc('telegram_coalesced_total')
+            return await asyncio.shield(existing.future)
+        item = OutboundItem(priority, chat_id, call, asyncio.get_running_loop().create_future(), key)
+        self._pending.append(item)
+        if key:
+            self._by_key[key] = item
+        self._wakeup.set()
+        return await asyncio.shield(item.future)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._inflight, return_exceptions=True)
+            self._task = None
+        for item in self._pending:
+            if not item.future.done():
+                item.future.set_exception(RuntimeError("Бот остановлен"))
+        self._pending.clear()
+        self._by_key.clear()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            wait = None
+            for item in sorted(self._pending, key=lambda i: (i.priority, i.seq)):
+                delay = max(self.global_bucket.delay(now), self._chat(item.chat_id).delay(now))
+                if delay <= 0:
+                    self._dispatch(item, now)
+                    wait = 0
+                    break
+                wait = delay if wait is None else min(wait, delay)
+            if wait == 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, item: OutboundItem, now: float):
+        self._pending.remove(item)
+        if item.key and self._by_key.get(item.key) is item:
+            del self._by_key[item.key]
+        self.global_bucket.take(now)
+        self._chat(item.chat_id).take(now)
+        metrics.observe('outbound_wait', now - item.submitted_at)
+        task = asyncio.create_task(self._execute(item))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, item: OutboundItem):
+        item.attempts += 1
+        metrics.inc('telegram_sends_total', priority=_PRIORITY_NAMES.get(item.priority, str(item.priority)))
+        try:
+            result = await item.call()
+        except TelegramRetryAfter as e:
+            metrics.inc('telegram_retry_after_total')
+            logger.warning(f"🚦 Telegram просит подождать {e.retry_after} сек (чат {item.chat_id})")
+            self._chat(item.chat_id).pause(e.retry_after)
+            if item.attempts >= self.max_attempts:
+                item.future.set_exception(e)
+                return
+            self._requeue(item)
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+        else:
+            if not item.future.done():
+                item.future.set_result(result)
+
+    def _requeue(self, item: OutboundItem):
+        newer = self._by_key.get(item.key) if item.key else None
+        if newer:
+            # Пока ждали, пришла более свежая версия — её результат отдаем и этому запросу
+            newer.future.add_done_callback(lambda f: _copy_result(f, item.future))
+            return
+        item.submitted_at = time.monotonic()
+        self._pending.append(item)
+        if item.key:
+            self._by_key[item.key] = item
+        self._wakeup.set()
+
+
+def _copy_result(source: asyncio.Future, target: asyncio.Future):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception():
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,194 @@
+"""
+Пул заранее загруженных страниц генератора makefilm.ai
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional, Set
+
+from playwright.async_api import BrowserContext, Page
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PagePool:
+    """
+    Держит size открытых страниц генератора с готовым полем ввода промпта.
+
+    Воркер берет страницу через acquire(), после работы возвращает её через
+    release(). Фоновая задача пополняет пул и периодически проверяет
+    свободные страницы, пересоздавая закрытые, устаревшие или ушедшие с url.
+    """
+
+    def __init__(
+        self,
+        context: BrowserContext,
+        url: str,
+        ready_selector: str,
+        size: int = 2,
+        reset: Optional[Callable[[Page], Awaitable[None]]] = None,
+        health_interval: float = 30.0,
+        max_page_age: float = 1800.0,
+        load_timeout: float = 60.0,
+    ):
+        self.context = context
+        self.url = url
+        self.ready_selector = ready_selector
+        self.size = max(1, size)
+        self._reset = reset
+        self._health_interval = health_interval
+        self._max_page_age = max_page_age
+        self._load_timeout = load_timeout
+        self._idle: Optional[asyncio.Queue] = None
+        self._busy: Set[Page] = set()
+        self._opened_at = {}
+        self._creating = 0
+        # Последняя ошибка открытия страницы и url, на котором она произошла (например, редирект на логин)
+        self.last_error: Optional[Exception] = None
+        self.last_error_url: Optional[str] = None
+        self._refill = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def idle(self) -> int:
+        return self._idle.qsize() if self._idle else 0
+
+    @property
+    def busy(self) -> int:
+        return len(self._busy)
+
+    @property
+    def total(self) -> int:
+        return self.idle + self.busy + self._creating
+
+    async def start(self):
+        """
+        Запускает фоновое пополнение и проверку страниц
+        """
+        if self._task:
+            return
+        self._idle = asyncio.Queue()
+        self._refill = asyncio.Event()
+        self._refill.set()
+        self._task = asyncio.create_task(self._maintain(), name="page-pool")
+
+    async def stop(self):
+        """
+        Останавливает пул и закрывает все страницы
+        """
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        pages = list(self._busy)
+        while self._idle and not self._idle.empty():
+            pages.append(self._idle.get_nowait())
+        self._busy.clear()
+        for page in pages:
+            await self._close(page)
+
+    async def acquire(self, timeout: Optional[float] = None) -> Page:
+        """
+        Выдает готовую страницу генератора, ожидая пополнения пула при необходимости
+        """
+        if not self._task:
+            raise RuntimeError("Пул страниц не запущен")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - loop.time())
+            page = await asyncio.wait_for(self._idle.get(), timeout=remaining)
+            if await self._is_healthy(page):
+                self._busy.add(page)
+                return page
+            logger.info("♻️ Страница из пула устарела, пересоздаю")
+            await self._close(page)
+            self._refill.set()
+
+    async def release(self, page: Page, reusable: bool = True):
+        """
+        Возвращает страницу в пул; при reusable=False страница закрывается и заменяется новой
+        """
+        self._busy.discard(page)
+        if reusable and self._idle is not None:
+            try:
+                if self._reset:
+                    await self._reset(page)
+                if await self._is_healthy(page):
+                    self._idle.put_nowait(page)
+                    return
+            except Exception as e:
+                logger.warning(f"Не удалось сбросить страницу пула: {e}")
+        await self._close(page)
+        if self._refill:
+            self._refill.set()
+
+    async def _is_healthy(self, page: Page) -> bool:
+        if page.is_closed() or not page.url.startswith(self.url):
+            return False
+        if time.monotonic() - self._opened_at.get(page, 0) > self._max_page_age:
+            return False
+        try:
+            return await page.query_selector(self.ready_selector) is not None
+        except Exception:
+            return False
+
+    async def _open_page(self) -> Page:
+        page = await self.context.new_page()
+        try:
+            with metrics.span('goto'):
+                await page.goto(self.url, wait_until='domcontentloaded', timeout=self._load_timeout * 1000)
+                await page.wait_for_selector(self.ready_selector, state='visible', timeout=self._load_timeout * 1000)
+        except Exception as e:
+            self.last_error = e
+            self.last_error_url = page.url
+            await page.close()
+            raise
+        self.last_error = None
+        self.last_error_url = None
+        self._opened_at[page] = time.monotonic()
+        return page
+
+    async def _close(self, page: Page):
+        self._opened_at.pop(page, None)
+        try:
+            if not page.is_closed():
+                await page.close()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии страницы пула: {e}")
+
+    async def _health_check(self):
+        for _ in range(self._idle.qsize()):
+            page = self._idle.get_nowait()
+            if await self._is_healthy(page):
+                self._idle.put_nowait(page)
+            else:
+                logger.info("♻️ Свободная страница пула не прошла проверку, пересоздаю")
+                await self._close(page)
+
+    async def _maintain(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._refill.wait(), timeout=self._health_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refill.clear()
+            try:
+                await self._health_check()
+                while self.total < self.size:
+                    self._creating += 1
+                    try:
+                        page = await self._open_page()
+                    finally:
+                        self._creating -= 1
+                    self._idle.put_nowait(page)
+                    logger.info(f"📄 Страница генератора готова ({self.total}/{self.size})")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Не удалось пополнить пул страниц: {e}")
+                await asyncio.sleep(5)
+                self._refill.set()
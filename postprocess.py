@@ -0,0 +1,201 @@
+"""
+Подготовка изображений к отправке в Telegram в отдельных процессах:
+уменьшение под лимиты фото, перекодирование без метаданных
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import sys
+import types
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from metrics import metrics
+
+try:
+    from PIL import ExifTags, Image, ImageOps
+except ImportError:  # Pillow не установлен — изображения отправляются как есть
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram для фото: размер файла и сумма ширины и высоты
+TELEGRAM_PHOTO_MAX_BYTES = 10 * 1024 * 1024
+TELEGRAM_PHOTO_MAX_DIMENSIONS = 10000
+
+
+@dataclass
+class ProcessedImage:
+    """
+    Результат обработки: фото для предпросмотра и (если запрошен) оригинал без метаданных
+    """
+    photo_path: str
+    width: int
+    height: int
+    document_path: Optional[str] = None
+
+
+def _flatten(image: 'Image.Image') -> 'Image.Image':
+    # JPEG не хранит прозрачность — подкладываем белый фон
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+def prepare_image(
+    source: Union[str, bytes],
+    directory: str,
+    max_side: int,
+    quality: int,
+    max_bytes: int = TELEGRAM_PHOTO_MAX_BYTES,
+    keep_original: bool = False,
+) -> ProcessedImage:
+    """
+    Выполняется в процессе пула: сохраняет в directory JPEG не больше max_side
+    по длинной стороне и max_bytes по размеру, без EXIF и прочих метаданных.
+    С keep_original рядом сохраняется оригинал в полном разрешении, тоже без метаданных.
+    """
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as original:
+        original.load()
+        source_format = original.format
+        rotated = original.getexif().get(ExifTags.Base.Orientation, 1) != 1
+        upright = ImageOps.exif_transpose(original)
+        image = _flatten(upright)
+
+        width, height = image.size
+        scale = min(1.0, max_side / max(width, height), TELEGRAM_PHOTO_MAX_DIMENSIONS / (width + height))
+        if scale < 1.0:
+            image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.LANCZOS)
+
+        # Снижаем качество, пока файл не уложится в лимит фото
+        while True:
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+            if buffer.tell() <= max_bytes or quality <= 40:
+                break
+            quality -= 10
+        photo_path = os.path.join(directory, f"photo_{uuid.uuid4().hex}.jpg")
+        with open(photo_path, 'wb') as f:
+            f.write(buffer.getvalue())
+
+        document_path = None
+        if keep_original:
+            # Пересохраняем без info/exif, поэтому поворот из EXIF применяется к самим пикселям.
+            # JPEG без поворота — с исходными таблицами квантования, остальное — в PNG без потерь
+            if source_format == 'JPEG' and not rotated:
+                document_path = os.path.join(directory, f"original_{uuid.uuid4().hex}.jpg")
+                original.save(document_path, 'JPEG', quality='keep', optimize=True)
+            elif source_format == 'JPEG':
+                document_path = os.path.join(directory, f"original_{uuid.uuid4().hex}.jpg")
+                upright.save(document_path, 'JPEG', quality=95, optimize=True)
+            else:
+                document_path = os.path.join(directory, f"original_{uuid.uuid4().hex}.png")
+                clean = upright.convert('RGBA') if upright.mode == 'P' else upright
+                clean.save(document_path, 'PNG', optimize=True)
+
+    return ProcessedImage(photo_path, image.width, image.height, document_path)
+
+
+def _warm_up() -> bool:
+    return Image is not None
+
+
+@contextmanager
+def _hidden_main():
+    """
+    Процессы пула запускаются внутри submit и по умолчанию выполняют заново
+    модуль __main__ (бот: Bot, брокер, кэш, aiogram и Playwright) как __mp_main__.
+    Пока __main__ подменен пустым модулем, multiprocessing его не передает.
+    """
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+
+class ImagePostProcessor:
+    """
+    Пул процессов для обработки изображений, чтобы перекодирование больших
+    файлов не блокировало event loop бота. Процессы создаются через
+    forkserver, а не fork из многопоточного процесса бота, поэтому пул можно
+    пересоздать в любой момент. Без Pillow (или с workers=0) process()
+    возвращает None, и файл отправляется как есть.
+    """
+
+    def __init__(self, directory: str, workers: int = 2, max_side: int = 2560,
+                 quality: int = 85, keep_original: bool = False):
+        self.directory = directory
+        self.workers = workers
+        self.max_side = max_side
+        self.quality = quality
+        self.keep_original = keep_original
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None and self.workers > 0
+
+    async def start(self):
+        if not self.enabled:
+            if self.workers > 0:
+                logger.warning("Pillow не установлен — изображения отправляются без обработки")
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._pool = self._new_pool()
+        # Одновременные задачи заставляют пул сразу запустить все процессы
+        await asyncio.gather(*[self._submit(_warm_up) for _ in range(self.workers)])
+        logger.info(f"✅ Пул обработки изображений запущен: процессов {self.workers}")
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # forkserver заранее импортирует только этот модуль, а не __main__ с ботом
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload(['postprocess'])
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+
+    def _submit(self, fn, *args) -> asyncio.Future:
+        with _hidden_main():
+            return asyncio.wrap_future(self._pool.submit(fn, *args))
+
+    async def stop(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def process(self, source: Union[str, bytes]) -> Optional[ProcessedImage]:
+        """
+        Готовит фото (и оригинал-документ) из файла или байтов; None — обработка
+        недоступна или не удалась
+        """
+        if not self._pool:
+            return None
+        try:
+            with metrics.span('postprocess'):
+                result = await self._submit(
+                    prepare_image, source, self.directory, self.max_side, self.quality,
+                    TELEGRAM_PHOTO_MAX_BYTES, self.keep_original,
+                )
+        except BrokenProcessPool:
+            # Процесс пула упал (например, не хватило памяти) — пересоздаем пул
+            logger.error("Пул обработки изображений сломан, перезапускаю")
+            metrics.inc('postprocess_failures_total', reason='pool')
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+            return None
+        except Exception as e:
+            logger.warning(f"Не удалось обработать изображение: {e}")
+            metrics.inc('postprocess_failures_total', reason='image')
+            return None
+        logger.info(f"Изображение подготовлено: {result.width}x{result.height}")
+        return result
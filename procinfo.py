@@ -0,0 +1,84 @@
+"""
+Сведения о памяти процессов (Linux, через /proc)
+"""
+
+import os
+from typing import Dict, List
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _children_map() -> Dict[int, List[int]]:
+    children: Dict[int, List[int]] = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Имя процесса в скобках может содержать пробелы — разбираем после последней ')'
+        fields = stat[stat.rfind(')') + 2:].split()
+        children.setdefault(int(fields[1]), []).append(int(name))
+    return children
+
+
+def process_rss(pid: int) -> int:
+    """
+    Резидентная память процесса в байтах (0, если процесс недоступен)
+    """
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def descendants(pid: int) -> List[int]:
+    """
+    Все потомки процесса pid
+    """
+    if not os.path.isdir('/proc'):
+        return []
+    children = _children_map()
+    result: List[int] = []
+    stack = list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        result.append(child)
+        stack.extend(children.get(child, []))
+    return result
+
+
+def children(pid: int) -> List[int]:
+    """
+    Прямые потомки процесса pid
+    """
+    if not os.path.isdir('/proc'):
+        return []
+    return _children_map().get(pid, [])
+
+
+def subtree_rss(pids) -> int:
+    """
+    Суммарная резидентная память процессов pids и всех их потомков
+    """
+    if not pids:
+        return 0
+    tree = _children_map()
+    total = 0
+    stack = list(pids)
+    while stack:
+        pid = stack.pop()
+        total += process_rss(pid)
+        stack.extend(tree.get(pid, []))
+    return total
+
+
+def descendants_rss(pid: int = None) -> int:
+    """
+    Суммарная резидентная память всех потомков процесса (по умолчанию текущего),
+    например драйвера Playwright и запущенного им браузера
+    """
+    return sum(process_rss(child) for child in descendants(pid or os.getpid()))
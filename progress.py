@@ -0,0 +1,141 @@
+"""
+Сообщение о прогрессе задачи: этап, прошедшее время и оценка оставшегося
+"""
+
+import asyncio
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, List, Optional, Tuple
+
+from aiogram.types import Message
+
+from job_queue import Job, JobQueue
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Этапы задачи в порядке выполнения и их описание для пользователя
+PROGRESS_STAGES: List[Tuple[str, str]] = [
+    ('page_acquire', '🌐 Открываю рабочую область'),
+    ('prompt_input', '✍️ Ввожу промпт'),
+    ('v1_pick', '⚙️ Выбираю модель'),
+    ('generate_click', '🎨 Запускаю генерацию'),
+    ('completion_wait', '🎨 Генерирую изображение'),
+    ('download', '⬇️ Скачиваю результат'),
+    ('telegram_upload', '📤 Отправляю изображение'),
+]
+_STAGE_NAMES = [name for name, _ in PROGRESS_STAGES]
+_STAGE_LABELS = dict(PROGRESS_STAGES)
+
+
+@contextmanager
+def job_stage(job: Job, stage: str) -> Iterator[None]:
+    """
+    Отмечает этап задачи для прогресса и замеряет его длительность
+    """
+    job.stage = stage
+    job.stage_started = time.monotonic()
+    with metrics.span(stage):
+        yield
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def estimate_remaining(job: Job, queue: JobQueue, stage: Optional[str] = None) -> Optional[float]:
+    """
+    Оценка оставшегося времени по медианам длительности этапов (None — мало данных)
+    """
+    medians = {}
+    for name in _STAGE_NAMES:
+        p50, _ = metrics.percentiles(name)
+        medians[name] = p50
+    if medians['completion_wait'] is None:
+        return None
+    durations = [value or 0.0 for value in medians.values()]
+    stage = stage or job.stage
+    if stage is None:
+        # В очереди: впереди position задач, воркеры берут их по workers за раз
+        position = queue.position(job) or 1
+        return math.ceil(position / queue.workers) * sum(durations)
+    index = _STAGE_NAMES.index(stage) if stage in _STAGE_NAMES else 0
+    in_stage = time.monotonic() - (job.stage_started or time.monotonic())
+    return max(0.0, durations[index] - in_stage) + sum(durations[index + 1:])
+
+
+class ProgressTracker:
+    """
+    Периодически редактирует сообщение об обработке: этап задачи, прошедшее
+    время и оценку оставшегося. Правки не чаще interval секунд и только при
+    изменении текста.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        job: Job,
+        queue: JobQueue,
+        edit: Callable[[Message, str], Awaitable[Any]],
+        interval: float = 10.0,
+    ):
+        self.message = message
+        self.job = job
+        self.queue = queue
+        self._edit = edit
+        self.interval = interval
+        self.started = time.monotonic()
+        # Этап этого получателя поверх этапа задачи (например, отправка результата)
+        self.stage: Optional[str] = None
+        self._last_text = message.text
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def text(self) -> str:
+        stage = self.stage or self.job.stage
+        elapsed = time.monotonic() - self.started
+        if stage is None:
+            position = self.queue.position(self.job) or self.job.remote_position
+            header = f"⏳ Ваш запрос в очереди, позиция: {position}" if position else "⏳ Обрабатываю ваш запрос…"
+        else:
+            header = f"{_STAGE_LABELS.get(stage, '⏳ Обрабатываю ваш запрос')}…"
+        line = f"⏱️ Прошло {_format_duration(elapsed)}"
+        eta = estimate_remaining(self.job, self.queue, stage)
+        if eta is not None:
+            line += f", осталось ≈ {_format_duration(eta)}"
+        return f"{header}\n{line}"
+
+    def start(self):
+        if self.interval <= 0 or self._task:
+            return
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает обновления, дождавшись уже начатой правки, чтобы она
+        не перезаписала итоговое сообщение
+        """
+        if self._task:
+            self._stop.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            text = self.text()
+            if text == self._last_text:
+                continue
+            self._last_text = text
+            try:
+                await self._edit(self.message, text)
+            except Exception as e:
+                logger.debug(f"Не удалось обновить прогресс: {e}")
@@ -0,0 +1,196 @@
+"""
+Постоянный кэш результатов генерации по нормализованному промпту
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = 'index.json'
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Приводит промпт к каноничному виду: регистр, ё/е, пробелы и пунктуация по краям
+    """
+    text = prompt.lower().replace('ё', 'е')
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip(' \t\n.,!?;:"\'«»')
+
+
+@dataclass
+class CacheEntry:
+    """
+    Запись кэша: сохраненный файл изображения и его file_id в Telegram
+    """
+    key: str
+    prompt: str
+    path: Optional[str]
+    size: int
+    created_at: float
+    last_used_at: float
+    file_id: Optional[str] = None
+
+
+class ResultCache:
+    """
+    Кэш готовых изображений с вытеснением по TTL, давности использования (LRU)
+    и ограничением на число записей и суммарный размер файлов.
+
+    Индекс хранится в index.json в каталоге кэша, рядом лежат копии файлов.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        model_version: str,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 500,
+        max_bytes: int = 500 * 1024 * 1024,
+    ):
+        self.directory = directory
+        self.model_version = model_version
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: Dict[str, CacheEntry] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, prompt: str) -> str:
+        """
+        Ключ кэша: хэш нормализованного промпта и версии модели
+        """
+        raw = f"{self.model_version}\n{normalize_prompt(prompt)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, prompt: str) -> Optional[CacheEntry]:
+        """
+        Возвращает свежую запись для промпта или None
+        """
+        entry = self._entries.get(self.key(prompt))
+        if entry and self._expired(entry):
+            self._remove(entry)
+            self._save()
+            entry = None
+        if not entry:
+            self.misses += 1
+            return None
+        entry.last_used_at = time.time()
+        self.hits += 1
+        self._save()
+        return entry
+
+    def put(
+        self, prompt: str, file_path: Optional[str], file_id: Optional[str], data: Optional[bytes] = None
+    ) -> Optional[CacheEntry]:
+        """
+        Сохраняет результат: копию файла или байты изображения (если есть) и file_id из Telegram
+        """
+        if not file_path and not file_id and not data:
+            return None
+        key = self.key(prompt)
+        old = self._entries.get(key)
+        if old:
+            self._remove(old)
+        path = None
+        size = 0
+        if file_path and os.path.exists(file_path):
+            ext = os.path.splitext(file_path)[1] or '.jpg'
+            path = os.path.join(self.directory, f"{key}{ext}")
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                shutil.copyfile(file_path, path)
+                size = os.path.getsize(path)
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить файл в кэш: {e}")
+                path = None
+        elif data:
+            path = os.path.join(self.directory, f"{key}.jpg")
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                size = len(data)
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить файл в кэш: {e}")
+                path = None
+        now = time.time()
+        entry = CacheEntry(key=key, prompt=prompt, path=path, size=size,
+                           created_at=now, last_used_at=now, file_id=file_id)
+        self._entries[key] = entry
+        self._evict()
+        self._save()
+        return entry
+
+    def forget_file_id(self, entry: CacheEntry):
+        """
+        Сбрасывает file_id, который Telegram больше не принимает
+        """
+        entry.file_id = None
+        if not entry.path:
+            self._remove(entry)
+        self._save()
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        if time.time() - entry.created_at > self.ttl:
+            return True
+        # Без file_id запись полезна только пока на диске есть файл
+        return not entry.file_id and not (entry.path and os.path.exists(entry.path))
+
+    def _remove(self, entry: CacheEntry):
+        self._entries.pop(entry.key, None)
+        if entry.path:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        for entry in [e for e in self._entries.values() if self._expired(e)]:
+            self._remove(entry)
+        by_lru = sorted(self._entries.values(), key=lambda e: e.last_used_at)
+        total = sum(e.size for e in by_lru)
+        while by_lru and (len(by_lru) > self.max_entries or total > self.max_bytes):
+            entry = by_lru.pop(0)
+            total -= entry.size
+            self._remove(entry)
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            self._entries = {item['key']: CacheEntry(**item) for item in raw}
+            self._evict()
+            logger.info(f"📦 Кэш результатов загружен: {len(self._entries)} записей")
+        except FileNotFoundError:
+            self._entries = {}
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать индекс кэша, начинаю с пустого: {e}")
+            self._entries = {}
+
+    def _save(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([asdict(e) for e in self._entries.values()], f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить индекс кэша: {e}")
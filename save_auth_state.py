@@ -2,18 +2,32 @@
 """
 Скрипт для сохранения состояния авторизации (storageState)
 Запустите один раз, авторизуйтесь вручную, и состояние сохранится
+
+Для нескольких аккаунтов запускайте с именем аккаунта:
+    python3 save_auth_state.py --account main
+Состояние сохранится в auth_states/main.json, бот подхватит все файлы из этого каталога
 """
 
+import argparse
 import asyncio
 import json
 import os
 from playwright.async_api import async_playwright
+from dotenv import load_dotenv
+
+# Каталог аккаунтов тот же, что у бота (в том числе из .env)
+load_dotenv()
+AUTH_STATES_DIR = os.getenv('AUTH_STATES_DIR', 'auth_states')
+AUTH_STATE_PATH = os.getenv('AUTH_STATE_PATH', 'auth_state.json')
 
-async def save_auth_state():
+async def save_auth_state(account: str = None):
     """
-    Сохраняет состояние авторизации в файл
+    Сохраняет состояние авторизации в файл (для именованного аккаунта — в каталог аккаунтов)
     """
-    print("🔐 Сохранение состояния авторизации...")
+    if account:
+        print(f"🔐 Сохранение состояния авторизации для аккаунта {account}...")
+    else:
+        print("🔐 Сохранение состояния авторизации...")
     
     try:
         async with async_playwright() as p:
@@ -68,18 +82,29 @@ async def save_auth_state():
                 print("⚠️ Авторизация не обнаружена, но продолжаем...")
             
             # Сохраняем состояние браузера
-            storage_state_file = "auth_state.json"
+            if account:
+                os.makedirs(AUTH_STATES_DIR, exist_ok=True)
+                first_account = not any(name.endswith('.json') for name in os.listdir(AUTH_STATES_DIR))
+                storage_state_file = os.path.join(AUTH_STATES_DIR, f"{account}.json")
+            else:
+                first_account = False
+                storage_state_file = AUTH_STATE_PATH
             await context.storage_state(path=storage_state_file)
             
             print(f"✅ Состояние авторизации сохранено в файл: {storage_state_file}")
+            if first_account and os.path.exists(AUTH_STATE_PATH):
+                # Бот берет аккаунты только из каталога, как только в нем появился хоть один файл
+                print(f"⚠️ Бот больше не будет использовать {AUTH_STATE_PATH}: аккаунты теперь берутся из {AUTH_STATES_DIR}/.")
+                print("   Чтобы оставить этот аккаунт в ротации, сохраните его так же: --account <имя>")
             
-            # Также сохраняем cookies для совместимости
-            cookies = await context.cookies()
-            cookies_file = "cookies.json"
-            with open(cookies_file, 'w', encoding='utf-8') as f:
-                json.dump(cookies, f, indent=2, ensure_ascii=False)
-            
-            print(f"✅ Cookies также сохранены в файл: {cookies_file}")
+            if not account:
+                # Также сохраняем cookies для совместимости
+                cookies = await context.cookies()
+                cookies_file = "cookies.json"
+                with open(cookies_file, 'w', encoding='utf-8') as f:
+                    json.dump(cookies, f, indent=2, ensure_ascii=False)
+                
+                print(f"✅ Cookies также сохранены в файл: {cookies_file}")
             
             print("\n🎉 Авторизация успешно сохранена!")
             print("🚀 Теперь можно запускать основного бота:")
@@ -94,4 +119,10 @@ async def save_auth_state():
         print(f"❌ Ошибка: {e}")
 
 if __name__ == "__main__":
-    asyncio.run(save_auth_state())
+    parser = argparse.ArgumentParser(description="Сохранение состояния авторизации makefilm.ai")
+    parser.add_argument(
+        "--account",
+        help=f"имя аккаунта; состояние сохранится в {AUTH_STATES_DIR}/<имя>.json",
+    )
+    args = parser.parse_args()
+    asyncio.run(save_auth_state(args.account))
@@ -0,0 +1,27 @@
+import asyncio
+
+from broker import SQLiteJobBroker
+
+
+def test_released_job_is_queued_again_without_losing_an_attempt(tmp_path):
+    async def run():
+        broker = SQLiteJobBroker(str(tmp_path / 'jobs.db'))
+        first = await broker.submit('котик', 1, 10)
+        second = await broker.submit('собака', 2, 20)
+        assert await broker.position(second) == 2
+
+        record = await broker.claim('worker-a', lease=30)
+        assert record.id == first
+        assert await broker.position(second) == 1
+        assert await broker.release(first, 'worker-a')
+        assert (await broker.get(first)).status == 'queued'
+        assert await broker.position(first) == 1
+
+        record = await broker.claim('worker-b', lease=30)
+        assert record.id == first
+        assert record.attempts == 1
+        # Чужой воркер не может вернуть задачу
+        assert not await broker.release(first, 'worker-a')
+        await broker.close()
+
+    asyncio.run(run())
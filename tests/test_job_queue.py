@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from job_queue import Job, JobQueue, QueueFullError
+
+
+def make_job(prompt: str) -> Job:
+    return Job(prompt=prompt, user_id=1, chat_id=1)
+
+
+def test_cancelled_job_frees_queue_capacity():
+    async def run():
+        ready = asyncio.Event()
+        queue = JobQueue(lambda job: asyncio.sleep(0), workers=1, maxsize=2)
+        # Воркеры ждут готовности, поэтому задачи остаются в очереди
+        await queue.start(ready=ready)
+        first, second = make_job('a'), make_job('b')
+        queue.submit(first)
+        queue.submit(second)
+        with pytest.raises(QueueFullError):
+            queue.submit(make_job('c'))
+
+        assert queue.cancel(first)
+        assert first.future.cancelled()
+        assert queue.depth == 1
+        third = make_job('c')
+        assert queue.submit(third) == 2
+
+        ready.set()
+        await asyncio.wait_for(asyncio.gather(second.future, third.future), timeout=1)
+        await queue.stop()
+
+    asyncio.run(run())
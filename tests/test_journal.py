@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+
+from journal import JobJournal
+
+
+def read_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_unfinished_requests_survive_reload(tmp_path):
+    path = str(tmp_path / 'jobs.jsonl')
+    journal = JobJournal(path)
+    assert journal.load() == []
+    done = journal.accepted('котик', 1, 10, 5, progress_message_id=6)
+    journal.record(done, 'started')
+    journal.record(done, 'completed', file_id='abc')
+    pending = journal.accepted('собака', 2, 20, 7, progress_message_id=8)
+    journal.record(pending, 'started')
+    asyncio.run(journal.stop())
+
+    entries = JobJournal(path).load()
+    assert len(entries) == 1
+    entry = entries[0]
+    assert entry['id'] == pending
+    assert entry['prompt'] == 'собака'
+    assert entry['chat_id'] == 20
+    assert entry['progress_message_id'] == 8
+    assert entry['state'] == 'started'
+
+
+def test_partial_last_line_is_skipped(tmp_path):
+    path = str(tmp_path / 'jobs.jsonl')
+    journal = JobJournal(path)
+    journal.load()
+    request_id = journal.accepted('котик', 1, 10)
+    asyncio.run(journal.stop())
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"id": "обрыв')
+
+    entries = JobJournal(path).load()
+    assert [entry['id'] for entry in entries] == [request_id]
+
+
+def test_compaction_keeps_only_open_requests(tmp_path):
+    path = str(tmp_path / 'jobs.jsonl')
+
+    async def run():
+        journal = JobJournal(path, flush_interval=0.01, compact_lines=10)
+        journal.load()
+        journal.start()
+        for i in range(10):
+            request_id = journal.accepted(f'промпт {i}', 1, 10)
+            journal.record(request_id, 'completed', file_id=str(i))
+        open_id = journal.accepted('последний', 1, 10)
+        await asyncio.sleep(0.1)
+        await journal.stop()
+        return open_id
+
+    open_id = asyncio.run(run())
+    lines = read_lines(path)
+    assert [line['id'] for line in lines] == [open_id]
+    assert [entry['id'] for entry in JobJournal(path).load()] == [open_id]
+
+
+def test_stop_waits_for_write_in_progress(tmp_path):
+    path = str(tmp_path / 'jobs.jsonl')
+    release = threading.Event()
+
+    async def run():
+        journal = JobJournal(path, flush_interval=0.01, compact_lines=1)
+        journal.load()
+        write = journal._write
+
+        def slow_write(lines, entries=None):
+            # Сжатие в потоке продолжается после отмены задачи журнала
+            if threading.current_thread() is not threading.main_thread():
+                release.wait(5)
+            write(lines, entries)
+
+        journal._write = slow_write
+        journal.start()
+        first = journal.accepted('первый', 1, 10)
+        await asyncio.sleep(0.05)
+        journal.record(first, 'completed', file_id='abc')
+        stopping = asyncio.create_task(journal.stop())
+        await asyncio.sleep(0.05)
+        release.set()
+        await stopping
+
+    asyncio.run(run())
+    assert JobJournal(path).load() == []
@@ -0,0 +1,44 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from media import MediaStore  # noqa: E402
+
+
+def make_file(directory, name, size, age):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_limit_spares_recent_files(tmp_path):
+    directory = str(tmp_path)
+    old = make_file(directory, 'old.jpg', 100, age=1000)
+    older = make_file(directory, 'older.jpg', 100, age=2000)
+    fresh = make_file(directory, 'fresh.jpg', 100, age=10)
+    store = MediaStore(directory, max_bytes=50, min_age=600)
+
+    store.enforce_limit()
+
+    assert not os.path.exists(older)
+    assert not os.path.exists(old)
+    # Свежий файл может ждать отправки — остается, даже если лимит превышен
+    assert os.path.exists(fresh)
+
+
+def test_expired_files_are_removed_under_limit(tmp_path):
+    directory = str(tmp_path)
+    expired = make_file(directory, 'expired.jpg', 10, age=4000)
+    kept = make_file(directory, 'kept.jpg', 10, age=1000)
+    store = MediaStore(directory, max_bytes=1024, max_age=3600, min_age=600)
+
+    store.enforce_limit()
+
+    assert not os.path.exists(expired)
+    assert os.path.exists(kept)
@@ -0,0 +1,58 @@
+"""
+Прием обновлений Telegram через webhook (альтернатива long polling)
+"""
+
+import logging
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+async def start_webhook_server(
+    dp: Dispatcher,
+    bot: Bot,
+    host: str,
+    port: int,
+    path: str,
+    secret: str,
+    public_url: Optional[str] = None,
+) -> web.AppRunner:
+    """
+    Запускает HTTP-сервер, принимающий обновления на path.
+
+    Запросы без заголовка X-Telegram-Bot-Api-Secret-Token с секретом
+    отклоняются; принятое обновление сразу подтверждается ответом 200,
+    а обрабатывается в фоне. Если задан public_url, webhook регистрируется
+    в Telegram (при нескольких экземплярах за балансировщиком достаточно одного).
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret,
+        handle_in_background=True,
+    ).register(app, path=path)
+
+    async def handle_health(request: web.Request) -> web.Response:
+        return web.Response(text='ok')
+
+    app.router.add_get('/healthz', handle_health)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"🌐 Webhook принимает обновления на http://{host}:{port}{path}")
+
+    if public_url:
+        url = public_url.rstrip('/') + path
+        await bot.set_webhook(
+            url,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(f"✅ Webhook зарегистрирован в Telegram: {url}")
+    return runner